@@ -1,15 +1,17 @@
 import sys
 
-from PySide6 import QtWidgets
-from PySide6.QtCore import QPoint
+width, height = (550, 740)
 
-import widgets as widgets
-from utils import Utils
 
-width, height = (550, 710)
+def run_gui():
+    global height
 
+    from PySide6 import QtWidgets
+    from PySide6.QtCore import QPoint
+
+    import widgets as widgets
+    from utils import Utils
 
-if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
     clipboard = app.clipboard()
 
@@ -30,3 +32,16 @@ if __name__ == "__main__":
     window.show()
 
     sys.exit(app.exec())
+
+
+if __name__ == "__main__":
+    # Scripted captures skip Qt entirely
+    if len(sys.argv) > 1 and sys.argv[1] == "capture":
+        from cli import main
+        sys.exit(main(sys.argv[2:]))
+
+    from remote import forward_to_running
+    if forward_to_running():
+        sys.exit(0)
+
+    run_gui()
@@ -0,0 +1,210 @@
+import time
+from itertools import combinations
+from statistics import median
+from threading import Lock, local
+
+import mss
+
+from frame import Frame
+
+# How many times each backend captures every monitor when working out which one is fastest
+CALIBRATION_ROUNDS = 3
+
+
+# Something that can grab an area of the desktop. Areas are mss style dicts of left, top, width and height
+# in device pixels, and can span more than one monitor
+class CaptureBackend:
+    name = ""
+
+    def grab(self, region: dict) -> Frame:
+        raise NotImplementedError
+
+    # Sets up whatever the calling thread needs for grabbing, so the first real grab doesn't have to
+    def prepare(self):
+        pass
+
+    # Called when the monitors change, so anything set up for the old ones can be thrown away
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Keeps one mss instance per thread (they can't be shared between threads), so the display connection and
+# monitor list are only set up once rather than for every capture.
+# mss holds a global lock around every grab, so grabs from several threads still happen one after another
+class MssBackend(CaptureBackend):
+    name = "mss"
+
+    def __init__(self):
+        self.__local = local()
+        self.__lock = Lock()
+        self.__generation = 0
+        self.__instances = []
+
+    def sct(self):
+        current = self.__local
+
+        with self.__lock:
+            generation = self.__generation
+
+        if getattr(current, "generation", None) != generation:
+            if getattr(current, "sct", None) is not None:
+                self.__forget(current.sct)
+
+            current.sct = mss.mss()
+            current.generation = generation
+
+            with self.__lock:
+                self.__instances.append(current.sct)
+
+        return current.sct
+
+    def grab(self, region: dict) -> Frame:
+        return Frame.from_shot(self.sct().grab(region))
+
+    def prepare(self):
+        self.sct()
+
+    # Every thread starts over with a fresh instance the next time it grabs
+    def invalidate(self):
+        with self.__lock:
+            self.__generation += 1
+
+    def close(self):
+        with self.__lock:
+            instances, self.__instances = self.__instances, []
+
+        for sct in instances:
+            sct.close()
+
+    def __forget(self, sct):
+        with self.__lock:
+            if sct in self.__instances:
+                self.__instances.remove(sct)
+
+        sct.close()
+
+
+# The backends that work anywhere, by name. Others (like Qt's, which needs a running application)
+# are added by whoever can provide them
+BACKENDS: dict[str, type[CaptureBackend]] = {
+    "mss": MssBackend
+}
+
+
+# Keeps the capture backend alive between captures.
+# The monitor layout always comes from mss, whichever backend does the grabbing
+class CaptureSession:
+    def __init__(self, backend: CaptureBackend = None):
+        self.__lock = Lock()
+        self.__mss = MssBackend()
+        self.backend: CaptureBackend = backend or self.__mss
+
+    # The whole virtual desktop and every monitor, as mss style dicts
+    def monitors(self) -> tuple[dict, list[dict]]:
+        monitors = [dict(m) for m in self.__mss.sct().monitors]
+        return monitors[0], monitors[1:]
+
+    def set_backend(self, backend: CaptureBackend):
+        with self.__lock:
+            old, self.backend = self.backend, backend
+
+        if old is not backend and old is not self.__mss:
+            old.close()
+
+        print(f"Capture: Using the {backend.name} backend")
+
+    def invalidate(self):
+        self.__mss.invalidate()
+
+        if self.backend is not self.__mss:
+            self.backend.invalidate()
+
+    # Monitors that sit edge to edge are grabbed in one go and handed out as crops of it, so they all come from
+    # the same moment. Otherwise it's one grab after another (mss can't grab from several threads at once),
+    # which leaves the monitors a grab's length apart
+    def grab_monitors(self, monitors: list[dict]) -> list[Frame]:
+        backend = self.backend
+        bounds = tiled_bounds(monitors)
+
+        if bounds is None:
+            return [backend.grab(mon) for mon in monitors]
+
+        frame = backend.grab(bounds)
+        return [frame.crop(m["left"] - bounds["left"], m["top"] - bounds["top"], m["width"], m["height"])
+                for m in monitors]
+
+    def grab_region(self, region: dict) -> Frame:
+        return self.backend.grab(region)
+
+    # Gets the calling thread ready to capture
+    def prepare(self):
+        self.backend.prepare()
+
+    # A single grab of the whole virtual desktop (mss monitor 0), with every monitor as a crop of it.
+    # The desktop itself comes last
+    def grab_desktop(self, desktop: dict, monitors: list[dict]) -> list[Frame]:
+        frame = self.backend.grab(desktop)
+
+        return [frame.crop(m["left"] - desktop["left"], m["top"] - desktop["top"], m["width"], m["height"])
+                for m in monitors] + [frame]
+
+    def close(self):
+        if self.backend is not self.__mss:
+            self.backend.close()
+        self.__mss.close()
+
+
+# The median time (in milliseconds) each backend takes to grab every monitor once.
+# Backends that fail are left out
+def calibrate(backends: list[CaptureBackend], monitors: list[dict]) -> dict[str, float]:
+    results = {}
+
+    for backend in backends:
+        timings = []
+
+        try:
+            # The first grab sets everything up, which every capture after it doesn't have to do
+            backend.grab(monitors[0])
+
+            for _ in range(CALIBRATION_ROUNDS):
+                start = time.perf_counter()
+                for mon in monitors:
+                    backend.grab(mon)
+                timings.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            print(f"Capture: The {backend.name} backend doesn't work here ({e})")
+            continue
+
+        results[backend.name] = median(timings)
+        print(f"Capture: The {backend.name} backend takes {results[backend.name]:.1f} ms")
+
+    return results
+
+
+# The area covered by the monitors, if they cover all of it without gaps or overlaps, so grabbing it
+# doesn't waste anything on pixels that aren't on any monitor
+def tiled_bounds(monitors: list[dict]) -> dict | None:
+    if len(monitors) < 2:
+        return None
+
+    left, top = min(m["left"] for m in monitors), min(m["top"] for m in monitors)
+    right = max(m["left"] + m["width"] for m in monitors)
+    bottom = max(m["top"] + m["height"] for m in monitors)
+
+    if sum(m["width"] * m["height"] for m in monitors) != (right - left) * (bottom - top):
+        return None
+
+    for a, b in combinations(monitors, 2):
+        if (a["left"] < b["left"] + b["width"] and b["left"] < a["left"] + a["width"] and
+                a["top"] < b["top"] + b["height"] and b["top"] < a["top"] + a["height"]):
+            return None
+
+    return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+
+# Identifies the monitor layout, so a calibration can be reused until the monitors change
+def topology_key(monitors: list[dict]) -> str:
+    return ",".join(f"{m['width']}x{m['height']}+{m['left']}+{m['top']}" for m in monitors)
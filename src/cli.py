@@ -0,0 +1,100 @@
+import argparse
+import sys
+
+from PIL import Image
+from mss.exception import ScreenShotError
+
+from capture import CaptureSession
+from frame import Frame
+
+# Anything here needs to stay away from Qt, requests and the themes, so scripted captures start up quickly
+
+
+def parse_region(value: str) -> tuple[int, int, int, int]:
+    try:
+        left, top, width, height = (int(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("regions are given as x,y,width,height")
+
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("regions need a positive width and height")
+
+    return left, top, width, height
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="Screpo.py capture", description="Take a screenshot without opening Screpo")
+
+    parser.add_argument("--monitor", type=int, default=1,
+                        help="the monitor to capture, starting at 1. 0 is the whole desktop (default: 1)")
+    parser.add_argument("--region", type=parse_region, metavar="X,Y,W,H",
+                        help="only capture this area, relative to the top left of the monitor")
+    parser.add_argument("--format", help="the image format, like png, jpeg or webp (default: from --out, or png)")
+    parser.add_argument("--quality", type=int, help="the quality for lossy formats, from 1 to 100")
+
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--out", metavar="FILE", help="where to save the screenshot")
+    output.add_argument("--stdout", action="store_true", help="write the screenshot to standard output")
+
+    return parser
+
+
+def image_format(name: str | None, filename: str | None) -> str:
+    if name:
+        name = name.upper()
+        return "JPEG" if name == "JPG" else name
+
+    if filename and "." in filename:
+        extension = "." + filename.rsplit(".", 1)[1].lower()
+        return Image.registered_extensions().get(extension, "PNG")
+
+    return "PNG"
+
+
+def capture(session: CaptureSession, monitor: int, region: tuple | None) -> Frame:
+    desktop, monitors = session.monitors()
+
+    if not 0 <= monitor <= len(monitors):
+        raise ValueError(f"there is no monitor {monitor} (there {'is' if len(monitors) == 1 else 'are'} "
+                         f"{len(monitors)})")
+
+    area = desktop if monitor == 0 else monitors[monitor - 1]
+
+    if region:
+        left, top = area["left"] + region[0], area["top"] + region[1]
+        right = min(left + region[2], area["left"] + area["width"])
+        bottom = min(top + region[3], area["top"] + area["height"])
+
+        if right <= left or bottom <= top:
+            raise ValueError("the region is outside of the monitor")
+
+        area = {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+    return session.grab_region(area)
+
+
+def main(argv: list[str]) -> int:
+    args = build_parser().parse_args(argv)
+    format = image_format(args.format, args.out)
+
+    params = {}
+    if args.quality is not None:
+        params["quality"] = args.quality
+
+    session = CaptureSession()
+
+    try:
+        frame = capture(session, args.monitor, args.region)
+
+        if args.stdout:
+            frame.save(sys.stdout.buffer, format, **params)
+            sys.stdout.buffer.flush()
+        else:
+            frame.save(args.out, format, **params)
+    except (ValueError, OSError, KeyError, ScreenShotError) as e:
+        print(f"Capture: {e}", file=sys.stderr)
+        return 1
+    finally:
+        session.close()
+
+    return 0
@@ -0,0 +1,175 @@
+import json
+import os
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from os.path import dirname
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtNetwork import QLocalServer, QLocalSocket
+
+from frame import Frame
+from remote import SOCKET_PATH, is_answering
+
+
+# The other end of remote.RemoteScrepo. Runs on the GUI thread, so requests see exactly the same history as the window.
+# Captures are handed over through captureRequested and answered once the window reports back with captured()
+class ControlServer(QObject):
+    captureRequested = Signal(dict)
+    activateRequested = Signal()
+
+    def __init__(self, history, path: str = SOCKET_PATH):
+        super().__init__()
+
+        self.history = history
+        self.path = path
+
+        self.__buffers: dict[QLocalSocket, bytes] = {}
+        self.__segments: dict[QLocalSocket, SharedMemory] = {}
+        self.__waiting: list[QLocalSocket] = []
+
+        os.makedirs(dirname(path), exist_ok=True)
+
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self.__accept)
+
+        # With socket options set, listening takes the path over even while another Screpo is listening on it,
+        # so that is checked first. Anything left over from a Screpo that didn't shut down properly is removed
+        if is_answering(path):
+            print(f"Remote: Another Screpo is already listening on {path}")
+            return
+
+        if not self.server.listen(path):
+            QLocalServer.removeServer(path)
+            self.server.listen(path)
+
+        if self.server.isListening():
+            print(f"Remote: Listening on {path}")
+        else:
+            print(f"Remote: Unable to listen on {path} ({self.server.errorString()})")
+
+    def captured(self, id: int, frames: list[Frame]):
+        waiting, self.__waiting = self.__waiting, []
+
+        for connection in waiting:
+            self.__reply_frames(connection, frames, id=id)
+
+    def capture_failed(self, error: str):
+        waiting, self.__waiting = self.__waiting, []
+
+        for connection in waiting:
+            self.__reply(connection, ok=False, error=error)
+
+    def close(self):
+        self.server.close()
+
+        for connection in list(self.__buffers):
+            connection.disconnectFromServer()
+        for segment in self.__segments.values():
+            self.__release(segment)
+        self.__segments.clear()
+
+    def __accept(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            self.__buffers[connection] = b""
+
+            connection.readyRead.connect(partial(self.__read, connection))
+            connection.disconnected.connect(partial(self.__disconnected, connection))
+
+    def __read(self, connection: QLocalSocket):
+        self.__buffers[connection] += bytes(connection.readAll())
+
+        while b"\n" in self.__buffers.get(connection, b""):
+            line, self.__buffers[connection] = self.__buffers[connection].split(b"\n", 1)
+            self.__handle(connection, line)
+
+    def __handle(self, connection: QLocalSocket, line: bytes):
+        try:
+            request = json.loads(line)
+            command = request["command"]
+        except (ValueError, KeyError, TypeError):
+            self.__reply(connection, ok=False, error="requests are JSON objects with a command")
+            return
+
+        if command == "capture":
+            options = {}
+
+            try:
+                if "monitor" in request:
+                    options["only"] = int(request["monitor"])
+                if "region" in request:
+                    left, top, width, height = (int(v) for v in request["region"])
+                    options["region"] = (left, top, width, height)
+            except (ValueError, TypeError):
+                self.__reply(connection, ok=False, error="monitor is a number and region is [x, y, width, height]")
+                return
+
+            self.__waiting.append(connection)
+            self.captureRequested.emit(options)
+        elif command == "list-history":
+            self.__reply(connection, ok=True, entries=[{"id": id, "time": self.history.timestamp(id)}
+                                                       for id in self.history.keys()])
+        elif command == "fetch-entry":
+            try:
+                frames = self.history[int(request["id"])]
+            except (KeyError, ValueError, TypeError):
+                self.__reply(connection, ok=False, error=f"there is no history entry {request.get('id')}")
+                return
+
+            self.__reply_frames(connection, frames, id=int(request["id"]))
+        elif command == "activate":
+            self.activateRequested.emit()
+            self.__reply(connection, ok=True)
+        else:
+            self.__reply(connection, ok=False, error=f"unknown command {command}")
+
+    def __reply(self, connection: QLocalSocket, **fields):
+        if connection.state() != QLocalSocket.LocalSocketState.ConnectedState:
+            return
+
+        connection.write(json.dumps(fields).encode() + b"\n")
+        connection.flush()
+
+    # Each frame's buffer goes into the connection's shared memory segment as it is (stride and all),
+    # so the only copy made is the one into the segment
+    def __reply_frames(self, connection: QLocalSocket, frames: list[Frame | None], **fields):
+        views = [f.view() if f is not None else None for f in frames]
+        total = sum(len(v) for v in views if v is not None)
+
+        segment = self.__segments.get(connection)
+        if segment is None or segment.size < total:
+            if segment is not None:
+                self.__release(segment)
+
+            segment = self.__segments[connection] = SharedMemory(create=True, size=max(total, 1))
+
+        layout, offset = [], 0
+        for frame, view in zip(frames, views):
+            if frame is None:
+                layout.append(None)
+                continue
+
+            segment.buf[offset:offset + len(view)] = view
+            layout.append({"offset": offset, "length": len(view), "width": frame.width, "height": frame.height,
+                           "stride": frame.stride})
+            offset += len(view)
+
+        self.__reply(connection, ok=True, shm=segment.name, frames=layout, **fields)
+
+    def __disconnected(self, connection: QLocalSocket):
+        self.__buffers.pop(connection, None)
+
+        if connection in self.__waiting:
+            self.__waiting.remove(connection)
+
+        segment = self.__segments.pop(connection, None)
+        if segment is not None:
+            self.__release(segment)
+
+        connection.deleteLater()
+
+    @staticmethod
+    def __release(segment: SharedMemory):
+        segment.close()
+        segment.unlink()
@@ -0,0 +1,163 @@
+from io import BytesIO
+from math import sqrt
+
+from PIL import Image
+
+from frame import Frame
+
+# Sizes are predicted from full resolution strips this many rows tall, taking one strip in every SAMPLE_FRACTION.
+# Shrinking the image instead blurs text and UI edges together, which makes lossless formats look 2-3x bigger
+STRIP_HEIGHT = 16
+SAMPLE_FRACTION = 8
+
+# Lossless candidates predicted to come within this much of the budget are encoded for real before
+# settling on a lossy format, in case the prediction was too high
+LOSSLESS_SLACK = 1.5
+
+# Predictions aren't exact, so aim a little under the budget
+SAFETY_MARGIN = 0.92
+
+MAX_ATTEMPTS = 4
+
+# The largest width or height WebP can store
+WEBP_MAX_SIZE = 16383
+
+
+class Candidate:
+    def __init__(self, name: str, format: str, params: dict, extension: str, lossless: bool):
+        self.name = name
+        self.format = format
+        self.params = params
+        self.extension = extension
+        self.lossless = lossless
+
+    @property
+    def mimetype(self) -> str:
+        return Image.MIME[self.format]
+
+    def encode(self, image: Image) -> bytes:
+        with BytesIO() as binary:
+            image.save(binary, self.format, **self.params)
+            return binary.getvalue()
+
+
+# In order of preference. Lossless formats are only passed over when they wouldn't fit
+CANDIDATES = [
+    Candidate("png-fast", "PNG", {"compress_level": 1}, "png", True),
+    Candidate("png-optimized", "PNG", {"compress_level": 9}, "png", True),
+    Candidate("webp-lossless", "WEBP", {"lossless": True, "quality": 0, "method": 0}, "webp", True),
+    Candidate("webp", "WEBP", {"quality": 85, "method": 4}, "webp", False),
+    Candidate("jpeg", "JPEG", {"quality": 85}, "jpg", False)
+]
+
+# Roughly how much smaller the slow PNG level comes out than the fast one, so it doesn't need sampling
+PNG_OPTIMIZED_RATIO = 0.85
+
+
+class Encoded:
+    def __init__(self, data: bytes, candidate: Candidate, size: tuple[int, int], attempts: int):
+        self.data = data
+        self.candidate = candidate
+        self.size = size
+        self.attempts = attempts
+
+    @property
+    def extension(self) -> str:
+        return self.candidate.extension
+
+    @property
+    def mimetype(self) -> str:
+        return self.candidate.mimetype
+
+
+# Picks the most preferred format predicted to fit in budget bytes (going by strips of the image), and scales
+# the image down only when nothing fits at full size. Every encode after the first corrects the prediction
+# with the size that actually came out, so it usually takes one or two encodes
+def encode_to_budget(frame: Frame, budget: int) -> Encoded:
+    image = frame.to_image(cache=False)
+    predicted = predict_sizes(image)
+    target = budget * SAFETY_MARGIN
+    attempts = 0
+
+    lossless = [c for c in CANDIDATES if c.lossless]
+    lossy = [c for c in CANDIDATES if not c.lossless]
+
+    # Lossless formats predicted to fit in order of preference, then any that only just missed
+    # (going lossy is a big step down, and the predictions are only ever within 10% or so),
+    # then lossy formats predicted to fit
+    for candidate in ([c for c in lossless if predicted[c.name] <= target] +
+                      sorted((c for c in lossless if target < predicted[c.name] <= budget * LOSSLESS_SLACK),
+                             key=lambda c: predicted[c.name]) +
+                      [c for c in lossy if predicted[c.name] <= target]):
+        data = candidate.encode(image)
+        attempts += 1
+
+        if len(data) <= budget:
+            return finish(Encoded(data, candidate, image.size, attempts))
+
+        correct(predicted, candidate, len(data))
+
+    # Nothing fits at full size, so shrink whichever lossy format comes out smallest.
+    # The encoded size goes roughly with the number of pixels
+    candidate = min(lossy, key=lambda c: predicted[c.name])
+    full_size = predicted[candidate.name]
+    limit = WEBP_MAX_SIZE / max(image.size) if candidate.format == "WEBP" else 1
+    scaled = 0
+
+    while True:
+        scale = min(sqrt(target / full_size), limit, 1)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+
+        data = candidate.encode(image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0))
+        attempts += 1
+        scaled += 1
+
+        if len(data) <= budget or scaled >= MAX_ATTEMPTS:
+            if len(data) > budget:
+                print(f"Encoding: Couldn't get under {budget / 1024 / 1024:.1f} MB in {attempts} attempts")
+            return finish(Encoded(data, candidate, size, attempts))
+
+        full_size = len(data) / (scale * scale)
+
+
+# What each candidate would come to at full size, from encoding evenly spaced full resolution strips of the image
+def predict_sizes(image: Image) -> dict[str, float]:
+    count = image.height // (STRIP_HEIGHT * SAMPLE_FRACTION)
+
+    if count > 0:
+        step = image.height / count
+        sample = Image.new(image.mode, (image.width, STRIP_HEIGHT * count))
+
+        for i in range(count):
+            top = int(i * step + (step - STRIP_HEIGHT) / 2)
+            sample.paste(image.crop((0, top, image.width, top + STRIP_HEIGHT)), (0, i * STRIP_HEIGHT))
+    else:
+        sample = image
+
+    ratio = image.height / sample.height
+
+    predicted = {}
+    for candidate in CANDIDATES:
+        if candidate.name == "png-optimized":
+            predicted[candidate.name] = predicted["png-fast"] * PNG_OPTIMIZED_RATIO
+        elif candidate.format == "WEBP" and max(image.size) > WEBP_MAX_SIZE:
+            predicted[candidate.name] = float("inf")
+        else:
+            predicted[candidate.name] = len(candidate.encode(sample)) * ratio
+
+    return predicted
+
+
+# Takes what a candidate actually came to into account. The slow PNG level is only ever guessed from the fast one
+def correct(predicted: dict[str, float], candidate: Candidate, size: int):
+    predicted[candidate.name] = size
+
+    if candidate.name == "png-fast":
+        predicted["png-optimized"] = min(predicted["png-optimized"], size * PNG_OPTIMIZED_RATIO)
+
+
+def finish(encoded: Encoded) -> Encoded:
+    print(f"Encoding: {encoded.candidate.name} at {encoded.size[0]}x{encoded.size[1]}, "
+          f"{len(encoded.data) / 1024 / 1024:.2f} MB after {encoded.attempts} "
+          f"encode{'s' if encoded.attempts != 1 else ''}")
+    return encoded
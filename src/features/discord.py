@@ -1,10 +1,19 @@
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Callable
 
-import requests
 from PySide6.QtWidgets import QInputDialog, QLineEdit
 
-from utils import Utils
+from encoding import encode_to_budget
+from utils import NEW_DIR, Utils
+from features.outbox import Outbox
+from features.uploads import SharedFiles, Upload, UploadQueue
+
+# Room left in the upload limit for the form fields and multipart boundaries
+FORM_OVERHEAD = 64 * 1024
+
+# The most files Discord takes in one message
+MAX_ATTACHMENTS = 10
 
 
 class Webhook:
@@ -23,28 +32,121 @@ class Discord:
 
         self.data = {}
 
-    def send_to_webhook(self, webhook: Webhook, image):
+        self.uploads = UploadQueue()
+
+        self.outbox = Outbox(self.uploads, NEW_DIR + "outbox/", self.__webhook_url)
+        self.outbox.on_sent = self.__mark_uploaded
+
+    # Queues the image to be encoded and sent in the background, returning the upload's id
+    def send_to_webhook(self, webhook: Webhook, image) -> int | None:
+        self.__set_username(webhook)
+
+        if callable(image):
+            image = image()
+
+        if image is None:
+            print("Discord: This monitor wasn't captured, nothing to send")
+            return
+
+        # The data is copied as it is now, since the message gets cleared again straight after this
+        id = self.__submit(webhook, dict(self.data), self.__encoder(image), [image])
+
+        print(f"Discord: Queued image for webhook: {webhook.name}")
+        return id
+
+    # Sends every monitor that was captured as attachments of a single message, encoding them all at once.
+    # Each gets an equal share of the upload limit
+    def send_all_to_webhook(self, webhook: Webhook, images) -> int | None:
+        self.__set_username(webhook)
+
+        if callable(images):
+            images = images()
+
+        images = [image for image in images if image is not None]
+
+        if not images:
+            print("Discord: Nothing was captured, nothing to send")
+            return
+
+        if len(images) > MAX_ATTACHMENTS:
+            print(f"Discord: Only the first {MAX_ATTACHMENTS} of {len(images)} monitors fit in one message")
+            images = images[:MAX_ATTACHMENTS]
+
+        name = f"{''.join([c for c in str(datetime.now()) if c.isalnum()])}-screpo"
+        budget = self.upload_budget() // len(images)
+
+        def encode() -> list[tuple]:
+            with ThreadPoolExecutor(max_workers=len(images), thread_name_prefix="Screpo Encode") as pool:
+                encoded = list(pool.map(lambda image: encode_to_budget(image, budget), images))
+
+            return [(f"files[{i}]", (f"{name}-{i + 1}.{e.extension}", e.data, e.mimetype))
+                    for i, e in enumerate(encoded)]
+
+        id = self.__submit(webhook, dict(self.data), encode, images)
+
+        print(f"Discord: Queued {len(images)} images for webhook: {webhook.name}")
+        return id
+
+    # Sends the image to every webhook in the group at once, encoding it only the once.
+    # Returns {upload id: webhook name}
+    def send_to_group(self, group: dict, image) -> dict[int, str]:
+        webhooks = [w for w in self.utils.settings.values["discord"]["webhooks"] if w.name in group["webhooks"]]
+
+        if not webhooks:
+            print(f"Discord: Group {group['name']} has no webhooks")
+            return {}
+
+        if callable(image):
+            image = image()
+
+        if image is None:
+            print("Discord: This monitor wasn't captured, nothing to send")
+            return {}
+
+        files = SharedFiles(self.__encoder(image))
+        ids = {}
+
+        for webhook in webhooks:
+            self.__set_username(webhook)
+            ids[self.__submit(webhook, dict(self.data), files, [image])] = webhook.name
+
+        print(f"Discord: Queued image for {len(webhooks)} webhooks in group: {group['name']}")
+        return ids
+
+    def __set_username(self, webhook: Webhook):
         if webhook.username != "":
             self.data["username"] = webhook.username
         elif self.utils.settings.values["discord"]["username"] is not None:
             self.data["username"] = self.utils.settings.values["discord"]["username"]
 
-        if callable(image):
-            image = image()
+    def __encoder(self, image) -> Callable[[], list[tuple]]:
+        name = f"{''.join([c for c in str(datetime.now()) if c.isalnum()])}-screpo"
+        budget = self.upload_budget()
+
+        # The format (and so the file's extension) is only known once the image has been encoded
+        def encode() -> list[tuple]:
+            encoded = encode_to_budget(image, budget)
+            filename = f"{name}.{encoded.extension}"
+            return [(filename, (filename, encoded.data, encoded.mimetype))]
+
+        return encode
+
+    # Goes through the outbox, so the upload is kept on disk until it has been sent
+    def __submit(self, webhook: Webhook, data: dict, files, images: list) -> int:
+        return self.outbox.submit(Upload(webhook.url, data, files, webhook.name),
+                                  [image.source for image in images if image.source])
+
+    def __webhook_url(self, name: str) -> str | None:
+        return next((w.url for w in self.utils.settings.values["discord"]["webhooks"] if w.name == name), None)
+
+    def __mark_uploaded(self, webhook: str, sources: list[tuple]):
+        if self.utils.library:
+            for source in sources:
+                self.utils.library.mark_uploaded(source, webhook)
 
-        with BytesIO() as binary:
-            image.save(binary, 'PNG')
-            binary.seek(0)
-            req = requests.post(
-                webhook.url,
-                data=self.data,
-                files={f"{''.join([c for c in str(datetime.now()) if c.isalnum()])}-screpo.png": binary}
-            )
-
-            if req.status_code == 200:
-                print(f"Discord: Image sent to webhook: {webhook.name}")
-            else:
-                print(f"Discord: Failed to send to the webhook ({req.content}: {req.status_code})")
+    def upload_budget(self) -> int:
+        limit = self.utils.settings.values["discord"].get("upload_limit_mb", 10)
+        return max(int(limit * 1024 * 1024) - FORM_OVERHEAD, FORM_OVERHEAD)
 
     def send_to_webhook_with_message(self, parent, webhook: Webhook, image):
         message, boolean = QInputDialog().getMultiLineText(parent, "Send Image to Webhook with Message", "Message:")
@@ -0,0 +1,137 @@
+import time
+from threading import Thread
+
+from PySide6.QtCore import QObject, Signal
+
+from features.x11 import create_wake_window, wake
+
+# How quickly a hotkey should turn into a capture, in milliseconds
+LATENCY_TARGET_MS = 50
+
+MODIFIERS = {
+    "ctrl": "ControlMask",
+    "shift": "ShiftMask",
+    "alt": "Mod1Mask",
+    "super": "Mod4Mask"
+}
+
+
+# System wide hotkeys through X11 key grabs on the root window, so they work whichever window has focus.
+# Bindings map an action to a key combination like "ctrl+shift+s". triggered is emitted from the listener
+# thread with the action and the time (time.perf_counter) the key press was read
+class HotkeyListener(QObject):
+    triggered = Signal(str, float)
+
+    def __init__(self, bindings: dict[str, str], display_name: str = None):
+        super().__init__()
+
+        # python-xlib is only a dependency on Linux
+        from Xlib import X, XK, display, error
+
+        self.X = X
+
+        self.__display = display.Display(display_name)
+        self.__root = self.__display.screen().root
+        self.__wake = create_wake_window(self.__display)
+        self.__running = True
+
+        # NumLock (Mod2) and CapsLock (Lock) shouldn't stop a hotkey from working, so every combination gets grabbed
+        self.__ignored = [0, X.LockMask, X.Mod2Mask, X.LockMask | X.Mod2Mask]
+        self.__bindings: dict[tuple[int, int], str] = {}
+
+        for action, combination in bindings.items():
+            try:
+                keycode, modifiers = self.__parse(combination, XK)
+            except ValueError as e:
+                print(f"Hotkeys: Can't bind {action} ({e})")
+                continue
+
+            catch = error.CatchError(error.BadAccess)
+            for ignored in self.__ignored:
+                self.__root.grab_key(keycode, modifiers | ignored, True, X.GrabModeAsync, X.GrabModeAsync,
+                                     onerror=catch)
+            self.__display.sync()
+
+            if catch.get_error():
+                print(f"Hotkeys: {combination} is already taken by another program, {action} won't work")
+                continue
+
+            self.__bindings[(keycode, modifiers)] = action
+            print(f"Hotkeys: Bound {combination} to {action}")
+
+        self.__thread = Thread(target=self.__run, name="Screpo Hotkeys", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+
+        try:
+            wake(self.__display.get_display_name(), self.__wake.id)
+        except Exception as e:
+            print(f"Hotkeys: Couldn't wake the listener to stop it ({e})")
+            return
+
+        self.__thread.join(1)
+
+    def __parse(self, combination: str, XK) -> tuple[int, int]:
+        *modifiers, key = [part.strip().lower() for part in combination.split("+")]
+
+        mask = 0
+        for modifier in modifiers:
+            if modifier not in MODIFIERS:
+                raise ValueError(f"unknown modifier {modifier}")
+            mask |= getattr(self.X, MODIFIERS[modifier])
+
+        keysym = XK.string_to_keysym(key) or XK.string_to_keysym(key.title())
+        keycode = self.__display.keysym_to_keycode(keysym) if keysym else 0
+
+        if not keycode:
+            raise ValueError(f"unknown key {key}")
+
+        return keycode, mask
+
+    def __run(self):
+        # Only the modifiers a binding can use, ignoring mouse buttons and the lock keys
+        relevant = 0
+        for name in MODIFIERS.values():
+            relevant |= getattr(self.X, name)
+
+        try:
+            while self.__running:
+                try:
+                    event = self.__display.next_event()
+                except Exception as e:
+                    if self.__running:
+                        print(f"Hotkeys: Lost the connection to the X server ({e})")
+                    return
+
+                if event.type != self.X.KeyPress or not self.__running:
+                    continue
+
+                action = self.__bindings.get((event.detail, event.state & relevant))
+                if action:
+                    self.triggered.emit(action, time.perf_counter())
+        finally:
+            self.__close()
+
+    def __close(self):
+        try:
+            self.__root.ungrab_key(self.X.AnyKey, self.X.AnyModifier)
+            self.__display.close()
+        except Exception:
+            pass
+
+
+def create_hotkey_listener(platform: str, bindings: dict[str, str], display_name: str = None) -> HotkeyListener | None:
+    if platform != "xcb":
+        print("Hotkeys: Global hotkeys are only supported on X11 for now")
+        return None
+
+    try:
+        return HotkeyListener(bindings, display_name)
+    except ImportError:
+        print("Hotkeys: python-xlib isn't installed, global hotkeys are disabled")
+    except Exception as e:
+        print(f"Hotkeys: Couldn't connect to the X server, global hotkeys are disabled ({e})")
+
+    return None
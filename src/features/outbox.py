@@ -0,0 +1,246 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from functools import partial
+from threading import Lock
+from typing import Callable
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from features.uploads import Upload, UploadQueue
+
+# How often anything left in the outbox is tried again
+DRAIN_INTERVAL = 60 * 1000
+
+# At most this many outbox items are resent at once, so a backlog doesn't crowd out new uploads
+MAX_RESENDING = 2
+
+METADATA = "item.json"
+SENT = "sent.json"
+
+
+# Every upload is written to the outbox once it has been encoded, and removed again once it has been sent.
+# Anything still there after an upload gives up (or after Screpo was closed part way through one) is resent
+# in the background, including after a restart. Each item has its own idempotency key, which goes out with
+# every attempt and keeps an item from being sent twice at the same time
+class Outbox(QObject):
+    # An upload that didn't go through, for letting the user know: its id, the webhook, what happened and whether
+    # it's been kept to be sent again. Only the first attempt at an item says so, resends that fail again don't
+    failed = Signal(int, str, str, bool)
+
+    def __init__(self, uploads: UploadQueue, directory: str, resolve: Callable[[str], str | None] = None):
+        super().__init__()
+
+        self.uploads = uploads
+        self.directory = directory
+
+        # Looks up the current url of a webhook by name, in case it changed since the item was written
+        self.resolve = resolve
+
+        # Called on the upload thread with the webhook's name and the (history id, monitor) of each image sent
+        self.on_sent: Callable[[str, list[tuple]], None] | None = None
+
+        self.__lock = Lock()
+        self.__sending: set[str] = set()
+        self.__resending: set[str] = set()
+
+        # Upload id -> (key, webhook, whether it's a resend)
+        self.__uploads: dict[int, tuple[str, str, bool]] = {}
+        self.__stopped = False
+
+        os.makedirs(directory, exist_ok=True)
+        self.__clean()
+
+        uploads.finished.connect(self.__on_finished)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(DRAIN_INTERVAL)
+        self.timer.timeout.connect(self.drain)
+        self.timer.start()
+
+        # Whatever was left over from last time
+        QTimer.singleShot(0, self.drain)
+
+    # Sends a new upload, keeping its files in the outbox until it has gone through
+    def submit(self, upload: Upload, sources: list[tuple]) -> int:
+        key = str(uuid.uuid4())
+        make = upload.files
+
+        def files() -> list[tuple]:
+            encoded = make() if callable(make) else make
+            self.__write(key, upload, encoded, sources)
+            return encoded
+
+        upload.files = files
+        self.__watch(upload, key, sources)
+
+        return self.__submit(upload, key)
+
+    def drain(self):
+        with self.__lock:
+            free = MAX_RESENDING - len(self.__resending)
+
+        for key in self.pending():
+            if free <= 0:
+                break
+
+            with self.__lock:
+                if key in self.__sending:
+                    continue
+
+            metadata = self.__read(key)
+            if metadata is None:
+                continue
+
+            url = (self.resolve(metadata["webhook"]) if self.resolve else None) or metadata["url"]
+
+            upload = Upload(url, metadata["data"], partial(self.__load, key, metadata["files"]), metadata["webhook"])
+            self.__watch(upload, key, [tuple(source) for source in metadata["sources"]])
+
+            print(f"Outbox: Resending {key} to {metadata['webhook']}")
+            self.__submit(upload, key, resend=True)
+            free -= 1
+
+    # Keys of the items waiting to be sent, oldest first
+    def pending(self) -> list[str]:
+        items = []
+
+        for key in os.listdir(self.directory):
+            try:
+                items.append((os.path.getmtime(os.path.join(self.directory, key, METADATA)), key))
+            except OSError:
+                continue
+
+        return [key for _, key in sorted(items)]
+
+    def stop(self):
+        self.__stopped = True
+        self.timer.stop()
+
+    def __submit(self, upload: Upload, key: str, resend: bool = False) -> int:
+        with self.__lock:
+            self.__sending.add(key)
+            if resend:
+                self.__resending.add(key)
+
+        id = self.uploads.submit(upload)
+
+        # finished is only delivered to this thread after this returns, so the id is always known by then
+        with self.__lock:
+            self.__uploads[id] = (key, upload.label, resend)
+
+        return id
+
+    def __watch(self, upload: Upload, key: str, sources: list[tuple]):
+        upload.headers["Idempotency-Key"] = key
+
+        def on_success(response):
+            self.__remove(key, sent=True)
+
+            if self.on_sent:
+                self.on_sent(upload.label, sources)
+
+        def on_rejected(response):
+            print(f"Outbox: {upload.label} refused {key} ({response.status_code}), dropping it")
+            self.__remove(key)
+
+        upload.on_success = on_success
+        upload.on_rejected = on_rejected
+
+    def __on_finished(self, id: int, ok: bool, rejected: bool, message: str):
+        with self.__lock:
+            if id not in self.__uploads:
+                return
+
+            key, label, resend = self.__uploads.pop(id)
+            self.__sending.discard(key)
+            self.__resending.discard(key)
+
+        if self.__stopped:
+            return
+
+        # Something getting through is a good sign that whatever else is waiting will too
+        if ok:
+            self.drain()
+        elif rejected:
+            self.failed.emit(id, label, message, False)
+        elif not resend:
+            # Nothing is kept if the upload failed before it could be written (like while encoding)
+            self.failed.emit(id, label, message, os.path.exists(os.path.join(self.directory, key, METADATA)))
+
+    def __write(self, key: str, upload: Upload, files: list[tuple], sources: list[tuple]):
+        folder = os.path.join(self.directory, key)
+        entries = []
+
+        try:
+            os.makedirs(folder, exist_ok=True)
+
+            for i, (field, (filename, data, mimetype)) in enumerate(files):
+                path = f"{i}-{filename}"
+                write_atomically(os.path.join(folder, path), data)
+                entries.append({"field": field, "filename": filename, "mimetype": mimetype, "path": path})
+
+            # The metadata goes last, as an item only counts once it's there
+            write_atomically(os.path.join(folder, METADATA), json.dumps({
+                "key": key,
+                "webhook": upload.label,
+                "url": upload.url,
+                "data": upload.data,
+                "files": entries,
+                "sources": sources,
+                "created": time.time()
+            }).encode())
+        except OSError as e:
+            print(f"Outbox: Unable to keep a copy of {key}, it won't be resent if it fails ({e})")
+
+    def __read(self, key: str) -> dict | None:
+        try:
+            with open(os.path.join(self.directory, key, METADATA), "rb") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Outbox: Unable to read {key} ({e})")
+            return None
+
+    def __load(self, key: str, entries: list[dict]) -> list[tuple]:
+        files = []
+
+        for entry in entries:
+            with open(os.path.join(self.directory, key, entry["path"]), "rb") as f:
+                files.append((entry["field"], (entry["filename"], f.read(), entry["mimetype"])))
+
+        return files
+
+    def __remove(self, key: str, sent: bool = False):
+        folder = os.path.join(self.directory, key)
+
+        # Marked as sent first, so it's never sent again even if deleting it doesn't work out
+        if sent:
+            try:
+                os.replace(os.path.join(folder, METADATA), os.path.join(folder, SENT))
+            except OSError:
+                pass
+
+        shutil.rmtree(folder, ignore_errors=True)
+
+    # Removes items that were sent but not deleted, or that were never finished being written
+    def __clean(self):
+        for key in os.listdir(self.directory):
+            folder = os.path.join(self.directory, key)
+
+            if os.path.isdir(folder) and not os.path.exists(os.path.join(folder, METADATA)):
+                shutil.rmtree(folder, ignore_errors=True)
+
+        pending = len(self.pending())
+        if pending:
+            print(f"Outbox: {pending} upload{'s' if pending != 1 else ''} waiting to be sent")
+
+
+def write_atomically(path: str, data: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,184 @@
+import email.utils
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Event, Lock
+from typing import Callable
+from urllib.parse import urlsplit
+
+import requests
+from PySide6.QtCore import QObject, Signal
+
+UPLOAD_WORKERS = 3
+MAX_ATTEMPTS = 5
+
+# Seconds to wait before the first retry (doubling after that) when the server doesn't say how long to wait
+BACKOFF_BASE = 1
+BACKOFF_CAP = 60
+
+TIMEOUT = (5, 60)
+
+
+class Upload:
+    def __init__(self, url: str, data: dict, files: Callable[[], list[tuple]] | list[tuple], label: str = ""):
+        self.id = 0
+        self.url = url
+        self.label = label or urlsplit(url).netloc
+
+        # Form fields (username, content...) sent along with the files
+        self.data = data
+
+        # [(field, (filename, bytes, content type))], or something that makes them, which is then called
+        # on the upload thread so encoding doesn't hold anything else up
+        self.files = files
+
+        self.headers: dict[str, str] = {}
+
+        # Called on the upload thread with the response once the upload has gone through,
+        # or once the server has refused it outright (so trying again wouldn't help)
+        self.on_success: Callable[[requests.Response], None] | None = None
+        self.on_rejected: Callable[[requests.Response], None] | None = None
+
+
+# Lets several uploads share one encode. Whichever upload thread gets to it first does the encoding while
+# the others wait, then they all send the same bytes (which requests only ever reads)
+class SharedFiles:
+    def __init__(self, make: Callable[[], list[tuple]]):
+        self.__make = make
+        self.__files: list[tuple] | None = None
+        self.__lock = Lock()
+
+    def __call__(self) -> list[tuple]:
+        with self.__lock:
+            if self.__files is None:
+                self.__files = self.__make()
+            return self.__files
+
+
+# Uploads run on a few background threads, sharing one requests.Session (and so its kept-alive connections)
+# per host. Rate limits and server errors are retried, waiting as long as the server asks to.
+# progress and finished are emitted from the upload threads with the upload's id.
+# finished says whether the upload went through, and if not whether the server refused it (so trying it again
+# wouldn't help) rather than it just not getting there
+class UploadQueue(QObject):
+    progress = Signal(int, str)
+    finished = Signal(int, bool, bool, str)
+
+    def __init__(self, workers: int = UPLOAD_WORKERS):
+        super().__init__()
+
+        self.__sessions: dict[str, requests.Session] = {}
+        self.__lock = Lock()
+        self.__ids = count(1)
+        self.__active = 0
+        self.__stopping = Event()
+
+        self.__pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Screpo Upload")
+
+    def submit(self, upload: Upload) -> int:
+        with self.__lock:
+            upload.id = next(self.__ids)
+            self.__active += 1
+
+        self.__pool.submit(self.__run, upload)
+        return upload.id
+
+    def active(self) -> int:
+        with self.__lock:
+            return self.__active
+
+    def shutdown(self):
+        self.__stopping.set()
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+        with self.__lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions.clear()
+
+    def session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+
+        with self.__lock:
+            if host not in self.__sessions:
+                self.__sessions[host] = requests.Session()
+            return self.__sessions[host]
+
+    def __run(self, upload: Upload):
+        try:
+            ok, rejected, message = self.__send(upload)
+        except Exception as e:
+            ok, rejected, message = False, False, str(e)
+
+        with self.__lock:
+            self.__active -= 1
+
+        print(f"Uploads: {upload.label}: {message}")
+        self.finished.emit(upload.id, ok, rejected, message)
+
+    # (went through, was refused, what happened)
+    def __send(self, upload: Upload) -> tuple[bool, bool, str]:
+        if callable(upload.files):
+            self.progress.emit(upload.id, "Encoding")
+            upload.files = upload.files()
+
+        session = self.session(upload.url)
+
+        for attempt in range(MAX_ATTEMPTS):
+            if self.__stopping.is_set():
+                return False, False, "Cancelled"
+
+            self.progress.emit(upload.id, "Sending" if attempt == 0 else f"Retrying ({attempt + 1}/{MAX_ATTEMPTS})")
+
+            try:
+                response = session.post(upload.url, data=upload.data, files=upload.files, headers=upload.headers,
+                                        timeout=TIMEOUT)
+            except requests.RequestException as e:
+                delay, reason = backoff(attempt), f"{type(e).__name__}"
+            else:
+                if response.ok:
+                    if upload.on_success:
+                        upload.on_success(response)
+                    return True, False, "Sent"
+
+                if response.status_code != 429 and response.status_code < 500:
+                    if upload.on_rejected:
+                        upload.on_rejected(response)
+                    return False, True, f"Rejected ({response.status_code}: {response.text[:200]})"
+
+                # Retry-After: 0 means straight away, rather than that the server didn't say
+                delay, reason = retry_after(response), str(response.status_code)
+                if delay is None:
+                    delay = backoff(attempt)
+
+            if attempt + 1 < MAX_ATTEMPTS:
+                self.progress.emit(upload.id, f"Waiting {delay:.0f}s ({reason})")
+
+                if self.__stopping.wait(delay):
+                    return False, False, "Cancelled"
+
+        return False, False, f"Gave up after {MAX_ATTEMPTS} attempts ({reason})"
+
+
+def backoff(attempt: int) -> float:
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_CAP)
+
+
+# How long the server asked us to wait, from the Retry-After header (in seconds or as a date)
+# or the retry_after Discord puts in its rate limit responses
+def retry_after(response: requests.Response) -> float | None:
+    header = response.headers.get("Retry-After")
+
+    if header:
+        try:
+            return max(float(header), 0)
+        except ValueError:
+            try:
+                return max(email.utils.parsedate_to_datetime(header).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+
+    try:
+        return max(float(response.json()["retry_after"]), 0)
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,234 @@
+from threading import Lock, Thread
+
+from PySide6.QtCore import QObject, Signal
+
+from features.x11 import create_wake_window, wake
+
+
+class TrackedWindow:
+    def __init__(self, id: int):
+        # The top level window (the window manager's frame if there is one) and the application window inside it
+        self.id = id
+        self.client = id
+
+        self.title = ""
+        self.x, self.y, self.width, self.height = 0, 0, 0, 0
+        self.mapped = False
+
+    # (left, top, width, height) in desktop coordinates, the same format region captures take
+    @property
+    def region(self) -> tuple:
+        return self.x, self.y, self.width, self.height
+
+    def on_monitor(self, monitor: dict) -> bool:
+        x, y = self.x + self.width // 2, self.y + self.height // 2
+
+        return (monitor["left"] <= x < monitor["left"] + monitor["width"] and
+                monitor["top"] <= y < monitor["top"] + monitor["height"])
+
+
+# Every top level window on the X11 desktop, kept up to date from the structure and property events of the
+# root window on a background thread, so listing windows or looking up where one is never talks to the X server.
+# A display name (like ":99" for Xvfb) can be given, otherwise $DISPLAY is used
+class WindowIndex(QObject):
+    changed = Signal()
+
+    def __init__(self, display_name: str = None):
+        super().__init__()
+
+        # python-xlib is only a dependency on Linux
+        from Xlib import X, display, error
+
+        self.X = X
+        self.XError = error.XError
+
+        self.__display = display.Display(display_name)
+        self.__root = self.__display.screen().root
+        self.__wake = create_wake_window(self.__display)
+
+        self.__atoms = {name: self.__display.intern_atom(name)
+                        for name in ("WM_STATE", "WM_NAME", "_NET_WM_NAME", "UTF8_STRING")}
+
+        self.__windows: dict[int, TrackedWindow] = {}
+        self.__lock = Lock()
+        self.__running = True
+
+        # Selecting the events before looking at the tree means nothing can slip through in between
+        self.__root.change_attributes(event_mask=X.SubstructureNotifyMask)
+
+        for child in self.__root.query_tree().children:
+            if child.id != self.__wake.id:
+                self.__track(child)
+
+        self.__thread = Thread(target=self.__run, name="Screpo Windows", daemon=True)
+        self.__thread.start()
+
+        print(f"Windows: Tracking {len(self.__windows)} windows on {self.__display.get_display_name()}")
+
+    def get(self, id: int) -> TrackedWindow | None:
+        with self.__lock:
+            return self.__windows.get(id)
+
+    # The visible, named windows whose centre is on the given monitor, sorted by title
+    def windows_on(self, monitor: dict, exclude: set[int] = frozenset()) -> list[TrackedWindow]:
+        with self.__lock:
+            windows = [w for w in self.__windows.values()
+                       if w.mapped and w.title and w.client not in exclude and w.on_monitor(monitor)]
+
+        return sorted(windows, key=lambda w: w.title.lower())
+
+    def stop(self):
+        self.__running = False
+
+        try:
+            wake(self.__display.get_display_name(), self.__wake.id)
+        except Exception as e:
+            print(f"Windows: Couldn't wake the window tracker to stop it ({e})")
+            return
+
+        self.__thread.join(1)
+
+    def __run(self):
+        try:
+            while self.__running:
+                try:
+                    event = self.__display.next_event()
+                except Exception as e:
+                    if self.__running:
+                        print(f"Windows: Lost the connection to the X server ({e})")
+                    return
+
+                try:
+                    if self.__running and self.__handle(event):
+                        self.changed.emit()
+                except self.XError:
+                    # The window went away before we got to ask about it, its DestroyNotify will clean up
+                    pass
+        finally:
+            try:
+                self.__display.close()
+            except Exception:
+                pass
+
+    def __handle(self, event) -> bool:
+        X = self.X
+
+        if event.type == X.CreateNotify:
+            return not event.override and self.__track(event.window)
+
+        if event.type == X.DestroyNotify:
+            with self.__lock:
+                return self.__windows.pop(event.window.id, None) is not None
+
+        if event.type == X.ReparentNotify:
+            if event.parent.id == self.__root.id:
+                return self.__track(event.window)
+
+            with self.__lock:
+                return self.__windows.pop(event.window.id, None) is not None
+
+        if event.type == X.ConfigureNotify:
+            with self.__lock:
+                window = self.__windows.get(event.window.id)
+                if window is None:
+                    return False
+
+                window.x, window.y = event.x, event.y
+                window.width = event.width + event.border_width * 2
+                window.height = event.height + event.border_width * 2
+            return window.mapped
+
+        if event.type in (X.MapNotify, X.UnmapNotify):
+            with self.__lock:
+                window = self.__windows.get(event.window.id)
+
+            if window is None:
+                return False
+
+            # Window managers usually reparent the application window into the frame just before mapping it
+            if event.type == X.MapNotify:
+                self.__find_client(event.window, window)
+
+            window.mapped = event.type == X.MapNotify
+            return True
+
+        if event.type == X.PropertyNotify and event.atom in (self.__atoms["WM_NAME"], self.__atoms["_NET_WM_NAME"]):
+            with self.__lock:
+                window = next((w for w in self.__windows.values() if w.client == event.window.id), None)
+
+            if window is None:
+                return False
+
+            window.title = self.__title(event.window)
+            return window.mapped
+
+        return False
+
+    def __track(self, xwindow) -> bool:
+        try:
+            attributes = xwindow.get_attributes()
+            geometry = xwindow.get_geometry()
+        except self.XError:
+            return False
+
+        # Menus, tooltips and the like
+        if attributes.override_redirect:
+            return False
+
+        window = TrackedWindow(xwindow.id)
+        window.x, window.y = geometry.x, geometry.y
+        window.width = geometry.width + geometry.border_width * 2
+        window.height = geometry.height + geometry.border_width * 2
+        window.mapped = attributes.map_state == self.X.IsViewable
+
+        self.__find_client(xwindow, window)
+
+        with self.__lock:
+            self.__windows[window.id] = window
+        return window.mapped
+
+    # The application window is the one with WM_STATE set, which is either the top level window itself
+    # or somewhere inside the window manager's frame
+    def __find_client(self, xwindow, window: TrackedWindow):
+        client = self.__client_of(xwindow) or xwindow
+
+        if client.id != window.client or not window.title:
+            client.change_attributes(event_mask=self.X.PropertyChangeMask)
+            window.client = client.id
+            window.title = self.__title(client)
+
+    def __client_of(self, xwindow, depth: int = 2):
+        if xwindow.get_full_property(self.__atoms["WM_STATE"], self.X.AnyPropertyType):
+            return xwindow
+
+        if depth:
+            for child in xwindow.query_tree().children:
+                client = self.__client_of(child, depth - 1)
+                if client:
+                    return client
+
+        return None
+
+    def __title(self, xwindow) -> str:
+        name = xwindow.get_full_property(self.__atoms["_NET_WM_NAME"], self.__atoms["UTF8_STRING"])
+        if name:
+            return name.value.decode("utf-8", "replace")
+
+        name = xwindow.get_wm_name()
+        if isinstance(name, bytes):
+            return name.decode("latin-1")
+        return name or ""
+
+
+def create_window_index(platform: str, display_name: str = None) -> WindowIndex | None:
+    if platform != "xcb":
+        return None
+
+    try:
+        return WindowIndex(display_name)
+    except ImportError:
+        print("Windows: python-xlib isn't installed, window capture is disabled")
+    except Exception as e:
+        print(f"Windows: Couldn't connect to the X server, window capture is disabled ({e})")
+
+    return None
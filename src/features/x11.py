@@ -0,0 +1,27 @@
+# A python-xlib display can't be used from two threads at once, so a listener thread blocked in next_event can't
+# just have its display closed from the GUI thread. Instead it's woken up by a message to a window of its own,
+# sent over a separate connection, and closes the display itself
+
+
+# An unmapped window that is never shown, only there to receive the wake up message.
+# Make it before selecting events on the root window, so it doesn't turn up as a new window
+def create_wake_window(display):
+    from Xlib import X
+
+    window = display.screen().root.create_window(0, 0, 1, 1, 0, 0, X.InputOnly, X.CopyFromParent)
+    display.flush()
+    return window
+
+
+def wake(display_name: str, window: int):
+    from Xlib import display, protocol
+
+    connection = display.Display(display_name)
+
+    try:
+        target = connection.create_resource_object("window", window)
+        target.send_event(protocol.event.ClientMessage(window=target, client_type=connection.intern_atom("_SCREPO_WAKE"),
+                                                       data=(32, [0] * 5)))
+        connection.flush()
+    finally:
+        connection.close()
@@ -0,0 +1,104 @@
+from PIL import Image
+
+BYTES_PER_PIXEL = 4
+
+
+# A screenshot kept as the raw BGRA buffer handed over by the capture backend.
+# QImage and PIL versions are only created when something actually asks for them, and are then cached
+class Frame:
+    __slots__ = ("buffer", "width", "height", "stride", "offset", "source", "_qimage", "_image")
+
+    def __init__(self, buffer: bytearray | bytes | memoryview, width: int, height: int, stride: int = None,
+                 offset: int = 0):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.stride = stride or width * BYTES_PER_PIXEL
+        self.offset = offset
+
+        # Where the frame is stored in the capture library, as (capture id, monitor index)
+        self.source: tuple[int, int] | None = None
+
+        self._qimage = None
+        self._image = None
+
+    @classmethod
+    def from_shot(cls, shot) -> "Frame":
+        # mss hands over a fresh bytearray for each grab, so it can be kept as it is
+        return cls(shot.raw, shot.width, shot.height)
+
+    @classmethod
+    def from_image(cls, image: Image) -> "Frame":
+        return cls(bytearray(image.convert("RGB").tobytes("raw", "BGRX")), image.width, image.height)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def nbytes(self) -> int:
+        return self.stride * self.height
+
+    def view(self) -> memoryview:
+        end = self.offset + self.stride * (self.height - 1) + self.width * BYTES_PER_PIXEL
+        return memoryview(self.buffer)[self.offset:end]
+
+    # A frame looking at part of this one's buffer, without copying anything
+    def crop(self, left: int, top: int, width: int, height: int) -> "Frame":
+        return Frame(self.buffer, width, height, self.stride, self.offset + top * self.stride + left * BYTES_PER_PIXEL)
+
+    def row(self, y: int) -> memoryview:
+        start = self.offset + self.stride * y
+        return memoryview(self.buffer)[start:start + self.width * BYTES_PER_PIXEL]
+
+    # Format_RGB32 is laid out as BGRX in memory on little-endian machines, so the QImage reads the
+    # capture buffer directly. Anything that needs to outlive the frame (like the clipboard) should copy() it
+    def to_qimage(self):
+        if self._qimage is None:
+            from PySide6.QtGui import QImage
+
+            self._qimage = QImage(self.view(), self.width, self.height, self.stride, QImage.Format.Format_RGB32)
+        return self._qimage
+
+    # Pass cache=False for one-off conversions (like encoding in the background) that shouldn't keep a copy around
+    def to_image(self, cache: bool = True) -> Image:
+        if self._image is not None:
+            return self._image
+
+        image = Image.frombuffer("RGB", self.size, self.view(), "raw", "BGRX", self.stride, 1)
+        if cache:
+            self._image = image
+        return image
+
+    # The buffer is read as RGBX without any conversion and box-reduced first, so only the tiny
+    # result is ever copied. The channels stay in BGRX order, which is exactly what a Frame holds
+    def thumbnail(self, size: tuple[int, int]) -> "Frame":
+        image = Image.frombuffer("RGBX", self.size, self.view(), "raw", "RGBX", self.stride, 1)
+
+        small = image.reduce(max(1, min(self.width // size[0], self.height // size[1])))
+        small.thumbnail(size)
+
+        return Frame(bytearray(small.tobytes()), small.width, small.height)
+
+    def save(self, fp, format: str = None, **params):
+        self.to_image().save(fp, format, **params)
+
+    # Drop the cached conversions, keeping only the raw buffer
+    def release(self):
+        self._qimage = None
+        self._image = None
+
+    # Overwrite a (left, top, right, bottom) box with the same area of another frame of the same size,
+    # or with black if there isn't one
+    def fill(self, box: tuple, source: "Frame" = None):
+        left, top, right, bottom = box
+        start, end = left * BYTES_PER_PIXEL, right * BYTES_PER_PIXEL
+
+        if source is not None and source.size != self.size:
+            source = None
+
+        blank = bytes(end - start)
+        for y in range(top, bottom):
+            self.row(y)[start:end] = source.row(y)[start:end] if source else blank
+
+        self.release()
@@ -0,0 +1,607 @@
+import os
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from threading import Lock
+from typing import Callable
+
+from frame import Frame, BYTES_PER_PIXEL
+from spill import SpillRing, overlaps
+
+MEGABYTE = 1024 * 1024
+
+# zlib's fastest level still shrinks a typical desktop screenshot to a fraction of its size
+COMPRESSION_LEVEL = 1
+
+TILE_SIZE = 64
+DIGEST_SIZE = 16
+
+
+# Compressed tiles shared between history entries, keyed by a hash of their pixels.
+# Consecutive screenshots of the same desktop are mostly identical, so most tiles end up being shared
+class TileStore:
+    def __init__(self):
+        self.__tiles: dict[bytes, list] = {}
+        self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self.__tiles)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self.__tiles
+
+    def __getitem__(self, digest: bytes) -> bytes:
+        return self.__tiles[digest][0]
+
+    def add(self, digest: bytes, data: bytes):
+        if digest in self.__tiles:
+            self.__tiles[digest][1] += 1
+        else:
+            self.__tiles[digest] = [data, 1]
+            self.nbytes += len(data)
+
+    def release(self, digest: bytes):
+        tile = self.__tiles[digest]
+        tile[1] -= 1
+
+        if tile[1] == 0:
+            del self.__tiles[digest]
+            self.nbytes -= len(tile[0])
+
+
+def split_tiles(frame: Frame):
+    for top in range(0, frame.height, TILE_SIZE):
+        rows = [frame.row(y) for y in range(top, min(top + TILE_SIZE, frame.height))]
+
+        for left in range(0, frame.width * BYTES_PER_PIXEL, TILE_SIZE * BYTES_PER_PIXEL):
+            tile = b"".join(r[left:left + TILE_SIZE * BYTES_PER_PIXEL] for r in rows)
+            yield blake2b(tile, digest_size=DIGEST_SIZE).digest(), tile
+
+
+def join_tiles(width: int, height: int, tiles: list[bytes]) -> Frame:
+    stride = width * BYTES_PER_PIXEL
+    buffer = bytearray(stride * height)
+    tiles = iter(tiles)
+
+    for top in range(0, height, TILE_SIZE):
+        tile_height = min(TILE_SIZE, height - top)
+
+        for left in range(0, stride, TILE_SIZE * BYTES_PER_PIXEL):
+            tile_stride = min(TILE_SIZE * BYTES_PER_PIXEL, stride - left)
+            tile = next(tiles)
+
+            for y in range(tile_height):
+                start = (top + y) * stride + left
+                buffer[start:start + tile_stride] = tile[y * tile_stride:(y + 1) * tile_stride]
+
+    return Frame(buffer, width, height)
+
+
+class HistoryEntry:
+    def __init__(self, id: int, frames: list[Frame] | None, timestamp: float = None):
+        self.id = id
+        self.time = timestamp or time.time()
+
+        # Hot entries keep their frames as they are, cold entries are made up of
+        # (width, height, tile digests) for each frame, pointing into the history's TileStore.
+        # Spilled entries live in the spill ring as (offset, length, tile lengths, [(width, height, tile indices)]).
+        # Monitors that weren't captured are None in all three
+        self.frames: list[Frame] | None = frames
+        self.encoded: list[tuple] | None = None
+        self.spilled: tuple | None = None
+        self.queued = False
+
+        # Entries loaded from somewhere else (like the capture library) only know how to fetch their frames,
+        # and which monitors they'll have
+        self.loader: Callable[[], list[Frame]] | None = None
+        self.loader_captured: list[bool] = []
+
+        self.thumbnail: Frame | None = None
+
+    @property
+    def nbytes(self) -> int:
+        if self.frames is not None:
+            # Frames can share a buffer (the monitors of a whole desktop capture), which only counts once
+            return sum(len(b) for b in {id(f.buffer): f.buffer for f in self.frames if f is not None}.values())
+        if self.encoded is not None:
+            return sum(len(e[2]) * DIGEST_SIZE for e in self.encoded if e is not None)
+        if self.spilled is not None:
+            return self.spilled[2].itemsize * (len(self.spilled[2]) +
+                                               sum(len(e[2]) for e in self.spilled[3] if e is not None))
+        return 0
+
+    def is_hot(self) -> bool:
+        return self.frames is not None
+
+    def is_spilled(self) -> bool:
+        return self.spilled is not None
+
+    def is_lazy(self) -> bool:
+        return self.loader is not None
+
+    # Which monitors were captured, without having to rebuild any of them
+    def captured(self) -> list[bool]:
+        if self.frames is not None:
+            return [f is not None for f in self.frames]
+        if self.encoded is not None:
+            return [e is not None for e in self.encoded]
+        if self.spilled is not None:
+            return [e is not None for e in self.spilled[3]]
+        return self.loader_captured
+
+
+# The frames of a cold history entry, which are only rebuilt once one of them is actually needed
+# (on whichever thread needs it first). Which monitors were captured is known straight away
+class EntryFrames(Sequence):
+    def __init__(self, history: "History", id: int, captured: list[bool]):
+        self.history = history
+        self.id = id
+        self.captured = captured
+
+        self.__frames: list[Frame | None] | None = None
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.captured)
+
+    def __getitem__(self, index):
+        return self.load()[index]
+
+    def is_captured(self, monitor: int) -> bool:
+        return self.captured[monitor]
+
+    def load(self) -> list[Frame | None]:
+        with self.__lock:
+            if self.__frames is None:
+                try:
+                    self.__frames = self.history[self.id]
+                except KeyError:
+                    print(f"History: Entry {self.id} was dropped before it could be rebuilt")
+                    self.__frames = [None] * len(self.captured)
+
+            return self.__frames
+
+
+def is_captured(frames: Sequence, monitor: int) -> bool:
+    if isinstance(frames, EntryFrames):
+        return frames.is_captured(monitor)
+    return frames[monitor] is not None
+
+
+class History:
+    def __init__(self, max_items: int = 8, budget_mb: int = 1024, hot_items: int = 1):
+        self.max_items = max_items
+        self.budget = budget_mb * MEGABYTE
+        self.hot_items = hot_items
+
+        self.__entries: OrderedDict[int, HistoryEntry] = OrderedDict()
+        self.__tiles = TileStore()
+        self.__next_id = 0
+        self.__lock = Lock()
+
+        # The last cold entry that was asked for, so flicking back and forth doesn't rebuild it every time
+        self.__decoded: tuple[int, list[Frame]] | None = None
+
+        # Entries pushed out by the memory budget go here (if it's enabled) rather than being dropped
+        self.__spill: SpillRing | None = None
+
+        # Running totals and queues (oldest first) so a capture never has to walk the whole history.
+        # Entries are removed from the queues lazily, so anything taken off them has to be checked first
+        self.__entry_bytes = 0
+        self.__hot: deque[HistoryEntry] = deque()
+        self.__resident: deque[HistoryEntry] = deque()
+        self.__spilled: deque[HistoryEntry] = deque()
+        self.__dropped: list[int] = []
+
+        # Hot entries pushed out by the budget, which are spilled once they've been encoded
+        # rather than compressing them while the lock is held
+        self.__spilling: list[HistoryEntry] = []
+
+        self.__encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Screpo History")
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.__entries
+
+    def __getitem__(self, id: int) -> list[Frame]:
+        with self.__lock:
+            entry = self.__entries[id]
+
+            if entry.is_hot():
+                return entry.frames
+
+            if self.__decoded and self.__decoded[0] == id:
+                return self.__decoded[1]
+
+            loader = entry.loader
+
+            if entry.is_spilled():
+                offset, length, lengths, layout = entry.spilled
+                data = self.__spill.read(offset, length)
+
+                starts = [0]
+                for size in lengths:
+                    starts.append(starts[-1] + size)
+
+                stored = [data[start:end] for start, end in zip(starts, starts[1:])]
+                encoded = [(e[0], e[1], [stored[i] for i in e[2]]) if e else None for e in layout]
+            elif entry.encoded is not None:
+                encoded = [(e[0], e[1], [self.__tiles[d] for d in e[2]]) if e else None for e in entry.encoded]
+
+        if loader is not None:
+            frames = loader()
+
+            with self.__lock:
+                self.__decoded = (id, frames)
+
+            return frames
+
+        # Tiles repeat a lot within a single frame too (empty desktop, window backgrounds...) so only decompress once
+        decompressed = {}
+
+        def decompress(tile: bytes) -> bytes:
+            if tile not in decompressed:
+                decompressed[tile] = zlib.decompress(tile)
+            return decompressed[tile]
+
+        frames = [join_tiles(e[0], e[1], [decompress(t) for t in e[2]]) if e else None for e in encoded]
+
+        with self.__lock:
+            self.__decoded = (id, frames)
+
+        return frames
+
+    # Hot entries (and the one that was rebuilt last) straight away, anything else as EntryFrames
+    def frames(self, id: int) -> Sequence:
+        with self.__lock:
+            entry = self.__entries[id]
+
+            if entry.is_hot():
+                return entry.frames.copy()
+
+            if self.__decoded and self.__decoded[0] == id:
+                return self.__decoded[1].copy()
+
+            return EntryFrames(self, id, entry.captured())
+
+    def keys(self) -> list[int]:
+        with self.__lock:
+            return list(self.__entries.keys())
+
+    def timestamp(self, id: int) -> float:
+        with self.__lock:
+            return self.__entries[id].time
+
+    def thumbnail(self, id: int) -> Frame | None:
+        with self.__lock:
+            entry = self.__entries.get(id)
+            return entry.thumbnail if entry else None
+
+    # Thumbnails go away with their entry, so this does nothing if the entry has already been dropped
+    def set_thumbnail(self, id: int, thumbnail: Frame) -> bool:
+        with self.__lock:
+            if id not in self.__entries:
+                return False
+
+            self.__entries[id].thumbnail = thumbnail
+            return True
+
+    def add(self, frames: list[Frame]) -> int:
+        with self.__lock:
+            entry = HistoryEntry(self.__next_id, frames)
+            self.__entries[entry.id] = entry
+            self.__entry_bytes += entry.nbytes
+            self.__next_id += 1
+
+            self.__hot.append(entry)
+            self.__resident.append(entry)
+
+            self.__evict()
+            self.__cool()
+
+        return entry.id
+
+    # Adds a monitor that was grabbed after the rest of the entry. Only possible while the entry is still hot
+    def fill(self, id: int, monitor: int, frame: Frame) -> bool:
+        with self.__lock:
+            entry = self.__entries.get(id)
+
+            if entry is None or not entry.is_hot() or entry.queued or monitor >= len(entry.frames):
+                return False
+
+            self.__entry_bytes -= entry.nbytes
+            entry.frames[monitor] = frame
+            self.__entry_bytes += entry.nbytes
+
+            self.__evict()
+
+        return True
+
+    # Adds an entry that only loads its frames once they are asked for
+    def add_lazy(self, loader: Callable[[], list[Frame]], timestamp: float, captured: list[bool]) -> int:
+        with self.__lock:
+            entry = HistoryEntry(self.__next_id, None, timestamp)
+            entry.loader = loader
+            entry.loader_captured = captured
+            self.__entries[entry.id] = entry
+            self.__next_id += 1
+
+            self.__evict()
+
+        return entry.id
+
+    def usage(self) -> int:
+        with self.__lock:
+            return self.__usage()
+
+    def spill_usage(self) -> int:
+        with self.__lock:
+            return sum(e.spilled[1] for e in self.__spilled if self.__is_live(e) and e.is_spilled())
+
+    # The ids of everything dropped since the last call, for anything that keeps its own per-entry state
+    def drain_dropped(self) -> list[int]:
+        with self.__lock:
+            dropped, self.__dropped = self.__dropped, []
+            return dropped
+
+    def configure(self, max_items: int = None, budget_mb: int = None, hot_items: int = None):
+        with self.__lock:
+            self.max_items = max_items or self.max_items
+            self.budget = budget_mb * MEGABYTE if budget_mb else self.budget
+            self.hot_items = hot_items or self.hot_items
+
+            self.__evict()
+            self.__cool()
+
+    # Passing no path turns spilling off, dropping anything that had already been spilled.
+    # A new size (or file) moves what was spilled over to the new ring, dropping the oldest of it if it doesn't fit
+    def set_spill(self, path: str | None, size_mb: int = 0):
+        with self.__lock:
+            if self.__spill and (self.__spill.path, self.__spill.size) == (path, size_mb * MEGABYTE):
+                return
+
+            if not path:
+                if self.__spill:
+                    self.__drop_spilled()
+            else:
+                # The new ring is built next to the old one when they share a file, and takes its place afterwards
+                replacing = self.__spill is not None and self.__spill.path == path
+
+                try:
+                    ring = SpillRing(path + ".new" if replacing else path, size_mb * MEGABYTE)
+                except OSError as e:
+                    print(f"History: Unable to create the spill file at {path} ({e})")
+                    ring = None
+
+                if ring and self.__spill:
+                    self.__move_spilled(ring)
+
+                    if replacing:
+                        os.replace(ring.path, path)
+                        ring.path = path
+
+                if ring:
+                    self.__spill = ring
+
+            self.__evict()
+
+    def shutdown(self):
+        self.__encoder.shutdown(wait=False, cancel_futures=True)
+
+        with self.__lock:
+            if self.__spill:
+                self.__drop_spilled()
+
+    # Everything below must be called with the lock held
+
+    def __is_live(self, entry: HistoryEntry) -> bool:
+        return self.__entries.get(entry.id) is entry
+
+    def __usage(self) -> int:
+        return self.__entry_bytes + self.__tiles.nbytes
+
+    # The newest entry is always kept, even if it's over budget on its own.
+    # Entries waiting to be spilled count as gone already, as they will be once they've been encoded
+    def __evict(self):
+        while len(self.__entries) > max(self.max_items, 1):
+            self.__drop(next(iter(self.__entries)))
+
+        newest = next(reversed(self.__entries), None)
+
+        self.__spilling = [e for e in self.__spilling if self.__is_live(e) and e.is_hot()]
+        leaving = sum(e.nbytes for e in self.__spilling)
+
+        while self.__usage() - leaving > self.budget:
+            while self.__resident and not (self.__is_live(self.__resident[0]) and
+                                           (self.__resident[0].is_hot() or self.__resident[0].encoded is not None)):
+                self.__resident.popleft()
+
+            if not self.__resident or self.__resident[0].id == newest:
+                break
+
+            entry = self.__resident.popleft()
+
+            if self.__spill and entry.is_hot():
+                self.__spill_later(entry)
+                leaving += entry.nbytes
+            elif not self.__spill or not self.__spill_entry(entry):
+                self.__drop(entry.id)
+
+    def __spill_later(self, entry: HistoryEntry):
+        self.__spilling.append(entry)
+
+        if not entry.queued:
+            entry.queued = True
+            self.__encoder.submit(self.__encode, entry)
+
+    # Queue anything that has fallen out of the newest hot_items entries to be encoded
+    def __cool(self):
+        while len(self.__hot) > self.hot_items:
+            entry = self.__hot.popleft()
+
+            if self.__is_live(entry) and entry.is_hot() and not entry.queued:
+                entry.queued = True
+                self.__encoder.submit(self.__encode, entry)
+
+    def __drop_spilled(self):
+        for entry in self.__spilled:
+            if self.__is_live(entry) and entry.is_spilled():
+                self.__drop(entry.id)
+
+        self.__spilled.clear()
+        self.__spill.close()
+        self.__spill = None
+
+    # Copies spilled entries into ring one at a time, newest ones first in line, and closes the old ring
+    def __move_spilled(self, ring: SpillRing):
+        spilled = [e for e in self.__spilled if self.__is_live(e) and e.is_spilled()]
+
+        kept, total = [], 0
+        for entry in reversed(spilled):
+            if total + entry.spilled[1] > ring.size:
+                break
+
+            kept.append(entry)
+            total += entry.spilled[1]
+
+        for entry in spilled[:len(spilled) - len(kept)]:
+            self.__drop(entry.id)
+
+        # Oldest first, so everything goes in back to back without wrapping
+        for entry in reversed(kept):
+            offset, length, lengths, layout = entry.spilled
+            entry.spilled = (ring.write([self.__spill.read(offset, length)])[0], length, lengths, layout)
+
+        self.__spilled = deque(reversed(kept))
+        self.__spill.close()
+
+        print(f"History: Moved {len(kept)} spilled entries to the new spill file")
+
+    def __drop(self, id: int):
+        entry = self.__entries.pop(id)
+        self.__entry_bytes -= entry.nbytes
+        self.__dropped.append(id)
+
+        if entry.encoded is not None:
+            self.__release_tiles(entry)
+
+        if self.__decoded and self.__decoded[0] == id:
+            self.__decoded = None
+
+        print(f"History: Dropped entry {id}")
+
+    def __release_tiles(self, entry: HistoryEntry):
+        for e in entry.encoded:
+            for d in e[2] if e else ():
+                self.__tiles.release(d)
+
+    # Only for encoded entries, so it never compresses anything. Each distinct tile of the entry is only written once
+    def __spill_entry(self, entry: HistoryEntry) -> bool:
+        frames = [(e[0], e[1], [(d, self.__tiles[d]) for d in e[2]]) if e else None for e in entry.encoded]
+
+        stored, positions, layout = [], {}, []
+        for frame in frames:
+            if frame is None:
+                layout.append(None)
+                continue
+
+            width, height, tiles = frame
+            indices = array("I")
+
+            for digest, data in tiles:
+                if digest not in positions:
+                    positions[digest] = len(stored)
+                    stored.append(data)
+                indices.append(positions[digest])
+
+            layout.append((width, height, indices))
+
+        lengths = array("I", (len(s) for s in stored))
+        offset = self.__spill.reserve(sum(lengths))
+
+        if offset is None:
+            return False
+
+        # Whatever is about to be overwritten has to go first
+        for other in self.__spilled:
+            if self.__is_live(other) and other.is_spilled() and overlaps(other.spilled[:2], (offset, sum(lengths))):
+                self.__drop(other.id)
+
+        while self.__spilled and not self.__is_live(self.__spilled[0]):
+            self.__spilled.popleft()
+
+        offset, length = self.__spill.write(stored)
+        self.__entry_bytes -= entry.nbytes
+
+        if entry.encoded is not None:
+            self.__release_tiles(entry)
+
+        entry.frames, entry.encoded = None, None
+        entry.spilled = (offset, length, lengths, layout)
+
+        self.__entry_bytes += entry.nbytes
+        self.__spilled.append(entry)
+
+        if self.__decoded and self.__decoded[0] == entry.id:
+            self.__decoded = None
+
+        print(f"History: Spilled entry {entry.id} to disk ({length / MEGABYTE:.1f} MB)")
+        return True
+
+    def __encode(self, entry: HistoryEntry):
+        frames = entry.frames
+        if frames is None:
+            return
+
+        encoded, new_tiles = [], {}
+        for frame in frames:
+            if frame is None:
+                encoded.append(None)
+                continue
+
+            digests = []
+
+            for digest, tile in split_tiles(frame):
+                # Checking without the lock is fine, tiles that disappear in the meantime get compressed below
+                if digest not in self.__tiles and digest not in new_tiles:
+                    new_tiles[digest] = zlib.compress(tile, COMPRESSION_LEVEL)
+                digests.append(digest)
+
+            encoded.append((frame.width, frame.height, digests))
+
+        with self.__lock:
+            if not self.__is_live(entry) or not entry.is_hot():
+                return
+
+            self.__entry_bytes -= entry.nbytes
+
+            for frame, e in zip(frames, encoded):
+                if e is None:
+                    continue
+
+                tiles = None
+                for i, d in enumerate(e[2]):
+                    if d not in self.__tiles and d not in new_tiles:
+                        tiles = tiles or [t for _, t in split_tiles(frame)]
+                        new_tiles[d] = zlib.compress(tiles[i], COMPRESSION_LEVEL)
+
+                    self.__tiles.add(d, new_tiles.get(d))
+
+            entry.encoded = encoded
+            entry.frames = None
+
+            self.__entry_bytes += entry.nbytes
+
+            # Back at the front of the line to be spilled (or dropped, if spilling was turned off since)
+            if entry in self.__spilling:
+                self.__spilling.remove(entry)
+                self.__resident.appendleft(entry)
+                self.__evict()
+
+        print(f"History: Entry {entry.id} encoded ({len(new_tiles)} new tiles, {len(self.__tiles)} total)")
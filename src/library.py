@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from PIL import Image
+
+from frame import Frame
+
+THUMBNAIL_SIZE = (160, 160)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_by_time ON captures (timestamp);
+
+CREATE TABLE IF NOT EXISTS images (
+    capture INTEGER NOT NULL REFERENCES captures (id) ON DELETE CASCADE,
+    monitor INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    phash TEXT NOT NULL,
+    webhooks TEXT NOT NULL DEFAULT '[]',
+    thumbnail BLOB,
+    blob TEXT NOT NULL,
+    PRIMARY KEY (capture, monitor)
+);
+CREATE INDEX IF NOT EXISTS images_by_phash ON images (phash);
+"""
+
+
+class LibraryCapture:
+    def __init__(self, id: int, timestamp: float, blobs: dict[int, str]):
+        self.id = id
+        self.timestamp = timestamp
+        self.blobs = blobs
+
+        # The thumbnail of the first monitor, as JPEG
+        self.thumbnail: bytes | None = None
+
+    # Which monitors load() will come back with
+    def captured(self) -> list[bool]:
+        return [monitor in self.blobs for monitor in range(max(self.blobs, default=-1) + 1)]
+
+    def thumbnail_frame(self) -> Frame | None:
+        if not self.thumbnail:
+            return None
+
+        with Image.open(BytesIO(self.thumbnail)) as image:
+            return Frame.from_image(image)
+
+
+# Every capture is kept in a SQLite index (metadata and a small thumbnail) with the full images
+# stored as files next to it. Writes happen on a background thread in the order they were made
+class CaptureLibrary:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.blob_dir = directory + "library/"
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self.__lock = Lock()
+        self.__db = sqlite3.connect(directory + "library.db", check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute("PRAGMA foreign_keys = ON")
+        self.__db.executescript(SCHEMA)
+
+        # Ids are handed out straight away so frames can be tagged with where they will be stored
+        # before the background write has actually happened
+        self.__next_id = (self.__db.execute("SELECT MAX(id) FROM captures").fetchone()[0] or 0) + 1
+
+        self.__writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Screpo Library")
+
+        print(f"Library: Opened capture library at {directory}")
+
+    def add(self, frames: list[Frame], timestamp: float = None) -> int:
+        with self.__lock:
+            capture_id = self.__next_id
+            self.__next_id += 1
+
+        for monitor, frame in enumerate(frames):
+            if frame is not None:
+                frame.source = (capture_id, monitor)
+
+        self.__writer.submit(self.__write, capture_id, timestamp or time.time(), frames)
+        return capture_id
+
+    # Adds a monitor that was grabbed after the rest of the capture
+    def add_monitor(self, capture_id: int, monitor: int, frame: Frame):
+        frame.source = (capture_id, monitor)
+        self.__writer.submit(self.__write_monitor, capture_id, monitor, frame)
+
+    def mark_uploaded(self, source: tuple[int, int], webhook: str):
+        self.__writer.submit(self.__mark_uploaded, source, webhook)
+
+    # The newest captures (oldest first), without touching any of the images
+    def recent(self, limit: int) -> list[LibraryCapture]:
+        with self.__lock:
+            rows = self.__db.execute("SELECT id, timestamp FROM captures ORDER BY timestamp DESC LIMIT ?",
+                                     (limit,)).fetchall()
+            if not rows:
+                return []
+
+            captures = {id: LibraryCapture(id, timestamp, {}) for id, timestamp in reversed(rows)}
+            images = self.__db.execute(
+                f"SELECT capture, monitor, blob, thumbnail FROM images WHERE capture IN "
+                f"({','.join('?' * len(captures))}) ORDER BY monitor",
+                list(captures)
+            ).fetchall()
+
+        for capture_id, monitor, blob, thumbnail in images:
+            captures[capture_id].blobs[monitor] = blob
+            captures[capture_id].thumbnail = captures[capture_id].thumbnail or thumbnail
+
+        return list(captures.values())
+
+    def load(self, capture: LibraryCapture) -> list[Frame]:
+        frames = []
+
+        for monitor in range(max(capture.blobs, default=-1) + 1):
+            if monitor not in capture.blobs:
+                frames.append(None)
+                continue
+
+            with Image.open(self.blob_dir + capture.blobs[monitor]) as image:
+                frame = Frame.from_image(image)
+
+            frame.source = (capture.id, monitor)
+            frames.append(frame)
+
+        return frames
+
+    def thumbnail(self, source: tuple[int, int]) -> bytes | None:
+        with self.__lock:
+            row = self.__db.execute("SELECT thumbnail FROM images WHERE capture = ? AND monitor = ?",
+                                    source).fetchone()
+        return row[0] if row else None
+
+    # Captures that look like the given frame, by the Hamming distance between their perceptual hashes
+    def similar(self, frame: Frame, distance: int = 6) -> list[tuple[int, int]]:
+        target = perceptual_hash(frame.to_image(cache=False))
+
+        with self.__lock:
+            rows = self.__db.execute("SELECT capture, monitor, phash FROM images").fetchall()
+
+        return [(capture_id, monitor) for capture_id, monitor, phash in rows
+                if bin(int(phash, 16) ^ int(target, 16)).count("1") <= distance]
+
+    def close(self):
+        self.__writer.shutdown(wait=True)
+
+        with self.__lock:
+            self.__db.close()
+
+    def __write(self, capture_id: int, timestamp: float, frames: list[Frame]):
+        rows = [self.__store_image(capture_id, monitor, frame) for monitor, frame in enumerate(frames)
+                if frame is not None]
+
+        with self.__lock:
+            with self.__db:
+                self.__db.execute("INSERT INTO captures (id, timestamp) VALUES (?, ?)", (capture_id, timestamp))
+                self.__db.executemany("INSERT INTO images (capture, monitor, width, height, phash, thumbnail, blob) "
+                                      "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def __write_monitor(self, capture_id: int, monitor: int, frame: Frame):
+        row = self.__store_image(capture_id, monitor, frame)
+
+        with self.__lock:
+            with self.__db:
+                self.__db.execute("INSERT OR REPLACE INTO images (capture, monitor, width, height, phash, thumbnail, "
+                                  "blob) VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    # Writes the image file and returns its row for the images table
+    def __store_image(self, capture_id: int, monitor: int, frame: Frame) -> tuple:
+        image = frame.to_image(cache=False)
+        blob = f"{capture_id // 1000:05}/{capture_id}-{monitor}.png"
+
+        os.makedirs(self.blob_dir + blob.split("/")[0], exist_ok=True)
+        image.save(self.blob_dir + blob, "PNG", compress_level=1)
+
+        return capture_id, monitor, frame.width, frame.height, perceptual_hash(image), make_thumbnail(frame), blob
+
+    def __mark_uploaded(self, source: tuple[int, int], webhook: str):
+        with self.__lock:
+            row = self.__db.execute("SELECT webhooks FROM images WHERE capture = ? AND monitor = ?",
+                                    source).fetchone()
+            if row is None:
+                return
+
+            webhooks = json.loads(row[0])
+            if webhook not in webhooks:
+                webhooks.append(webhook)
+
+            with self.__db:
+                self.__db.execute("UPDATE images SET webhooks = ? WHERE capture = ? AND monitor = ?",
+                                  (json.dumps(webhooks), *source))
+
+
+# A 64-bit difference hash, which stays the same through scaling and re-encoding
+def perceptual_hash(image: Image) -> str:
+    small = image.reduce(max(1, min(image.size) // 64)).convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+
+    return f"{bits:016x}"
+
+
+def make_thumbnail(frame: Frame) -> bytes:
+    with BytesIO() as binary:
+        frame.thumbnail(THUMBNAIL_SIZE).save(binary, "JPEG", quality=80)
+        return binary.getvalue()
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, QSize, Qt, Signal, Slot
+from PySide6.QtGui import QImage, QPixmap
+
+from frame import Frame
+from history import is_captured
+
+PREVIEW_CAPACITY = 32
+THUMBNAIL_SIZE = (48, 27)
+
+
+# Scaled down previews of every (history entry, monitor), made in the background right after a capture
+# so switching between monitors and history entries is just a lookup
+class PreviewCache(QObject):
+    ready = Signal(int, int)
+    thumbnailReady = Signal(int)
+
+    _scaled = Signal(int, int, QImage)
+
+    def __init__(self, size: QSize, capacity: int = PREVIEW_CAPACITY):
+        super().__init__()
+
+        self.size = size
+        self.capacity = capacity
+
+        self.__pixmaps: OrderedDict[tuple[int, int], QPixmap] = OrderedDict()
+        self.__pending: set[tuple[int, int]] = set()
+
+        self.__scaler = ThreadPoolExecutor(max_workers=2, thread_name_prefix="Screpo Preview")
+
+        # Scaling happens on the pool, but pixmaps can only be made on the GUI thread
+        self._scaled.connect(self.__store)
+
+    def get(self, id: int, monitor: int) -> QPixmap | None:
+        pixmap = self.__pixmaps.get((id, monitor))
+
+        if pixmap is not None:
+            self.__pixmaps.move_to_end((id, monitor))
+        return pixmap
+
+    # frames can be the EntryFrames of a cold history entry, which then get rebuilt on the pool rather than here
+    def request(self, id: int, frames: Sequence[Frame | None]):
+        for monitor in range(len(frames)):
+            if not is_captured(frames, monitor) or (id, monitor) in self.__pixmaps or (id, monitor) in self.__pending:
+                continue
+
+            self.__pending.add((id, monitor))
+            self.__scaler.submit(self.__scale, id, monitor, frames)
+
+    def request_thumbnail(self, id: int, frame: Frame, history):
+        self.__scaler.submit(self.__make_thumbnail, id, frame, history)
+
+    def discard(self, ids: list[int]):
+        ids = set(ids)
+
+        for key in [k for k in self.__pixmaps if k[0] in ids]:
+            del self.__pixmaps[key]
+
+    def shutdown(self):
+        self.__scaler.shutdown(wait=False, cancel_futures=True)
+
+    def __scale(self, id: int, monitor: int, frames: Sequence[Frame | None]):
+        try:
+            image = frames[monitor].to_qimage().scaled(self.size, Qt.AspectRatioMode.KeepAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation)
+        except Exception as e:
+            print(f"Preview: Failed to scale monitor {monitor} of entry {id} ({e})")
+            image = QImage()
+
+        self._scaled.emit(id, monitor, image)
+
+    def __make_thumbnail(self, id: int, frame: Frame, history):
+        try:
+            if history.set_thumbnail(id, frame.thumbnail(THUMBNAIL_SIZE)):
+                self.thumbnailReady.emit(id)
+        except Exception as e:
+            print(f"Preview: Failed to make a thumbnail for entry {id} ({e})")
+
+    @Slot(int, int, QImage)
+    def __store(self, id: int, monitor: int, image: QImage):
+        self.__pending.discard((id, monitor))
+
+        if image.isNull():
+            return
+
+        self.__pixmaps[(id, monitor)] = QPixmap.fromImage(image)
+        self.__pixmaps.move_to_end((id, monitor))
+
+        while len(self.__pixmaps) > self.capacity:
+            self.__pixmaps.popitem(last=False)
+
+        self.ready.emit(id, monitor)
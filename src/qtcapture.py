@@ -0,0 +1,88 @@
+from threading import Event
+
+from PySide6.QtCore import QObject, QRect, QThread, Qt, Signal, Slot
+from PySide6.QtGui import QGuiApplication, QImage, QPainter
+
+from capture import CaptureBackend
+from frame import Frame
+
+# How long a grab from another thread waits for the GUI thread before giving up (like when it's busy shutting down)
+GRAB_TIMEOUT = 2
+
+
+# A grab handed over to the GUI thread, which the result goes back in.
+# Each grab gets its own, so one that turns up after its caller gave up can't be mistaken for a later one
+class GrabRequest:
+    def __init__(self, region: dict):
+        self.region = region
+        self.done = Event()
+        self.abandoned = False
+        self.result: Frame | Exception | None = None
+
+
+# Grabs through QScreen.grabWindow, which has to happen on the GUI thread.
+# Grabs from any other thread are handed over to it and wait until they are done
+class QtBackend(QObject, CaptureBackend):
+    name = "qt"
+
+    _requested = Signal(object)
+
+    def __init__(self):
+        QObject.__init__(self)
+
+        self._requested.connect(self.__grab, Qt.ConnectionType.QueuedConnection)
+
+    def grab(self, region: dict) -> Frame:
+        if QThread.currentThread() is self.thread():
+            return self.grab_here(region)
+
+        request = GrabRequest(region)
+        self._requested.emit(request)
+
+        if not request.done.wait(GRAB_TIMEOUT):
+            request.abandoned = True
+            raise TimeoutError("The GUI thread didn't get around to grabbing the screen")
+
+        if isinstance(request.result, Exception):
+            raise request.result
+        return request.result
+
+    # Each screen is grabbed separately (in its own coordinates) and drawn into place,
+    # so regions spanning more than one monitor work the same as with mss
+    def grab_here(self, region: dict) -> Frame:
+        target = QRect(region["left"], region["top"], region["width"], region["height"])
+        image = QImage(target.size(), QImage.Format.Format_RGB32)
+        image.fill(Qt.GlobalColor.black)
+
+        painter = QPainter(image)
+        for screen in QGuiApplication.screens():
+            ratio = screen.devicePixelRatio()
+            geometry = screen.geometry()
+            native = QRect(round(geometry.x() * ratio), round(geometry.y() * ratio),
+                           round(geometry.width() * ratio), round(geometry.height() * ratio))
+
+            area = native.intersected(target)
+            if area.isEmpty():
+                continue
+
+            left, top = round((area.x() - native.x()) / ratio), round((area.y() - native.y()) / ratio)
+            pixmap = screen.grabWindow(0, left, top, round(area.width() / ratio), round(area.height() / ratio))
+
+            # Draw it pixel for pixel rather than at its logical size
+            pixmap.setDevicePixelRatio(1)
+            painter.drawPixmap(area.topLeft() - target.topLeft(), pixmap)
+        painter.end()
+
+        return Frame(bytearray(image.constBits()), image.width(), image.height(), image.bytesPerLine())
+
+    @Slot(object)
+    def __grab(self, request: GrabRequest):
+        if request.abandoned:
+            return
+
+        try:
+            request.result = self.grab_here(request.region)
+        except Exception as e:
+            request.result = e
+
+        request.done.set()
@@ -0,0 +1,117 @@
+import json
+import os
+import socket
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from os.path import expanduser
+
+from frame import Frame
+
+# Screpo's control socket, which the running instance listens on. Nothing in here touches Qt, so scripts and
+# a second launch of Screpo can use it cheaply
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or expanduser("~") + "/Screpo", "screpo.sock")
+
+
+class RemoteError(Exception):
+    pass
+
+
+# Talks to a running Screpo over its control socket. Requests and replies are single lines of JSON, with the pixels
+# of any frames left in a shared memory segment that belongs to this connection (and is reused by the next reply)
+class RemoteScrepo:
+    def __init__(self, path: str = SOCKET_PATH, timeout: float = 10):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+
+        self.reader = self.socket.makefile("rb")
+
+    def __enter__(self) -> "RemoteScrepo":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def request(self, command: str, **arguments) -> dict:
+        self.socket.sendall(json.dumps({"command": command, **arguments}).encode() + b"\n")
+
+        line = self.reader.readline()
+        if not line:
+            raise RemoteError("Screpo closed the connection")
+
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise RemoteError(reply.get("error", "unknown error"))
+        return reply
+
+    # Takes a new screenshot, of one monitor (counting from 0) or a (left, top, width, height) region if given.
+    # Returns the id of the new history entry and its frames
+    def capture(self, monitor: int = None, region: tuple = None) -> tuple[int, list[Frame | None]]:
+        arguments = {}
+        if monitor is not None:
+            arguments["monitor"] = monitor
+        if region is not None:
+            arguments["region"] = list(region)
+
+        reply = self.request("capture", **arguments)
+        return reply["id"], self.__frames(reply)
+
+    # [{"id": ..., "time": ...}], oldest first
+    def list_history(self) -> list[dict]:
+        return self.request("list-history")["entries"]
+
+    def fetch_entry(self, id: int) -> list[Frame | None]:
+        return self.__frames(self.request("fetch-entry", id=id))
+
+    # Brings the running Screpo to the front
+    def activate(self):
+        self.request("activate")
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+    @staticmethod
+    def __frames(reply: dict) -> list[Frame | None]:
+        segment = SharedMemory(reply["shm"])
+
+        # Attaching registers the segment with this process' resource tracker, which would remove it on exit
+        # even though it belongs to Screpo
+        resource_tracker.unregister(segment._name, "shared_memory")
+
+        try:
+            return [Frame(bytearray(segment.buf[f["offset"]:f["offset"] + f["length"]]), f["width"], f["height"],
+                          f["stride"]) if f else None for f in reply["frames"]]
+        finally:
+            segment.close()
+
+
+# Whether a running Screpo is listening on the socket, rather than it being left over from one that didn't shut down
+# properly. Connecting is enough to tell, a socket nothing listens on any more refuses the connection
+def is_answering(path: str = SOCKET_PATH) -> bool:
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return False
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(2)
+            s.connect(path)
+    except OSError:
+        return False
+
+    return True
+
+
+# Used when Screpo is launched while it's already running, so the running one comes to the front instead
+def forward_to_running() -> bool:
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(SOCKET_PATH):
+        return False
+
+    try:
+        with RemoteScrepo(timeout=2) as remote:
+            remote.activate()
+    except (OSError, RemoteError, ValueError):
+        return False
+
+    print("Remote: Screpo is already running, bringing it to the front")
+    return True
@@ -0,0 +1,68 @@
+import mmap
+import os
+from os.path import dirname
+
+
+# A fixed size file that history entries are written into back to back, wrapping around to the start once
+# the end is reached. Reads go through mmap so spilled entries only take up page cache rather than heap.
+# Anything that gets overwritten is lost, so the owner has to drop the entries in a region before reusing it
+class SpillRing:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.head = 0
+
+        os.makedirs(dirname(path), exist_ok=True)
+
+        self.__fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        os.ftruncate(self.__fd, size)
+
+        # Allocate the blocks up front so the ring can't run out of disk space halfway through a write
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.__fd, 0, size)
+            except OSError:
+                pass
+
+        self.__map = mmap.mmap(self.__fd, size)
+
+        print(f"History: Spilling to {path} ({size // (1024 * 1024)} MB)")
+
+    # Where the next write of this length will go, or None if it could never fit
+    def reserve(self, length: int) -> int | None:
+        if length > self.size:
+            return None
+
+        return 0 if self.head + length > self.size else self.head
+
+    def write(self, chunks: list[bytes]) -> tuple[int, int] | None:
+        length = sum(len(c) for c in chunks)
+        offset = self.reserve(length)
+
+        if offset is None:
+            return None
+
+        position = offset
+        for c in chunks:
+            self.__map[position:position + len(c)] = c
+            position += len(c)
+
+        self.head = position
+        return offset, length
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self.__map[offset:offset + length]
+
+    # Nothing in the ring outlives it, so the file goes too rather than leaving its whole size taken up on disk
+    def close(self):
+        self.__map.close()
+        os.close(self.__fd)
+
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"History: Unable to remove the spill file at {self.path} ({e})")
+
+
+def overlaps(a: tuple[int, int], b: tuple[int, int]) -> bool:
+    return a[0] < b[0] + b[1] and b[0] < a[0] + a[1]
@@ -3,15 +3,17 @@ import os
 import sys
 from os.path import expanduser, exists
 from enum import Enum, auto
+from functools import partial
 
-import mss
-from PIL import Image
 from PySide6 import QtWidgets
 from PySide6.QtGui import QGuiApplication, Qt, QPixmap, QIcon
 from PySide6.QtCore import QSize
 
 # noinspection PyUnresolvedReferences
 import resources
+from capture import BACKENDS, CaptureSession, calibrate, topology_key
+from frame import Frame
+from history import History
 
 
 class BuildType(Enum):
@@ -28,6 +30,9 @@ BUILD: BuildType = BuildType.DEVELOPMENT if any(c in sys.argv for c in ["-d", "-
 OLD_DIR = expanduser("~") + "/"
 NEW_DIR = OLD_DIR + "/Screpo/"
 FILE = ".screpo"
+SPILL_FILE = NEW_DIR + "history/spill.bin"
+
+CAPTURE_MODES = ["monitors", "desktop", "lazy"]
 
 
 class Utils:
@@ -40,39 +45,199 @@ class Utils:
 
         self.app_ref = app
         self.clipboard = app.clipboard()
-        self.history = {}
 
         self.settings = Settings()
 
+        self.history = History()
+        self.apply_history_settings()
+
         self.themes: list[Theme] = get_all_themes()
         self.current_theme: Theme = next((x for x in self.themes if x.filename ==
                                           self.settings.values["general"]["appearance"]["current_theme"]), None)
 
         self.discordRef = None
+        self.library = None
+        self.hotkeys = None
+
+        self.capture = CaptureSession()
+        self.desktop, self.monitors = self.capture.monitors()
 
-        with mss.mss() as mons:
-            self.monitors = mons.monitors[1:]
+        # Switching backends is handed to the capture worker (once there is one), so it happens in between captures
+        self.captureWorker = None
+        self.__deferred = []
+
+        # How long the backend in use took to grab every monitor when it was picked, in milliseconds
+        self.captureLatency: float | None = None
+        self.select_capture_backend()
+
+        from features.windows import create_window_index
+        self.windowIndex = create_window_index(app.platformName())
 
         self.check_refs()
+        self.load_library_history()
+
+    # exclude is a (left, top, width, height) rectangle in desktop coordinates that gets painted over with the
+    # matching area of the backdrop frames (or black if there aren't any) so Screpo doesn't appear in its own captures.
+    # Passing a region (in the same format) grabs only that area instead of every monitor, and passing a window id
+    # from the window index grabs wherever that window is right now. Passing only grabs just that monitor,
+    # leaving None in place of the others
+    def capture_monitors(self, exclude: tuple = None, backdrop: list[Frame] = None, region: tuple = None,
+                         window: int = None, only: int = None) -> list[Frame]:
+        if window is not None and self.windowIndex:
+            tracked = self.windowIndex.get(window)
+
+            if tracked is None:
+                raise LookupError(f"Window {window:#x} no longer exists")
+
+            # Windows can hang off the edge of the desktop, which X11 refuses to grab
+            region = clip_region(tracked.region, self.monitors)
+            if region is None:
+                raise LookupError(f"Window {window:#x} is entirely off screen")
+
+        # Regions have nothing to paint Screpo over with, so it's just blanked out
+        if region:
+            left, top, width, height = region
+            area = {"left": left, "top": top, "width": width, "height": height}
+            frame = self.capture.grab_region(area)
+
+            if exclude:
+                paint_over(frame, area, exclude)
+            return [frame]
+
+        if only is not None:
+            shots = [None] * len(self.monitors)
+            shots[only] = self.capture.grab_monitors([self.monitors[only]])[0]
+        elif self.settings.values["general"]["capture"]["capture_mode"] == "desktop" and len(self.monitors) > 1:
+            shots = self.capture.grab_desktop(self.desktop, self.monitors)
+        else:
+            shots = self.capture.grab_monitors(self.monitors)
+
+        # The monitors of a desktop capture share its buffer, so painting over them covers the desktop frame too
+        if exclude:
+            for i, (frame, mon) in enumerate(zip(shots, self.monitors)):
+                if frame is not None:
+                    paint_over(frame, mon, exclude, backdrop[i] if backdrop and i < len(backdrop) else None)
+
+        return shots
+
+    # Run on the capture thread ahead of time, so the first capture (say from a hotkey) is as quick as the rest
+    def prepare_capture(self):
+        self.capture.prepare()
+
+    # Reconnects the capture session and reads the monitors again. Returns whether anything changed
+    def refresh_monitors(self) -> bool:
+        self.capture.invalidate()
+        desktop, monitors = self.capture.monitors()
 
-    def capture_monitors(self) -> list[Image]:
-        shots = []
+        if (desktop, monitors) == (self.desktop, self.monitors):
+            return False
+
+        self.desktop, self.monitors = desktop, monitors
+        print(f"Monitors: Now {len(monitors)} monitor{'s' if len(monitors) != 1 else ''} "
+              f"({desktop['width']}x{desktop['height']} desktop)")
+
+        self.select_capture_backend()
+        return True
 
-        with mss.mss() as sct:
-            for mon in self.monitors:
-                shot = sct.grab(mon)
-                img = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+    # Uses the backend picked in the settings, or otherwise whichever one was fastest for this monitor layout.
+    # Backends are only timed again when the layout changes (or recalibrate is passed). Timing and switching
+    # happen on the capture thread, so the GUI never waits on them and the backend in use is never closed
+    # part way through a grab. Until then captures carry on with the current backend
+    def select_capture_backend(self, recalibrate: bool = False):
+        from qtcapture import QtBackend
 
-                shots.append(img)
+        backends = {**BACKENDS, QtBackend.name: QtBackend}
+        capture = self.settings.values["general"]["capture"]
+        topology = topology_key(self.monitors)
 
-        if len(self.history) > self.settings.values["general"]["performance"]["history_max_items"]:
-            del self.history[list(self.history.keys())[0]]
+        name = capture["backend"]
 
-        if len(self.history):
-            self.history[list(self.history.keys())[-1] + 1] = shots.copy()
+        if name in backends:
+            self.on_capture_thread(partial(self.__switch_backend, backends[name](), None))
+        elif (not recalibrate and capture["calibrated_topology"] == topology and
+              capture["calibrated_backend"] in backends):
+            self.on_capture_thread(partial(self.__switch_backend, backends[capture["calibrated_backend"]](),
+                                           capture["calibrated_latency_ms"]))
         else:
-            self.history[0] = shots.copy()
-        return shots
+            # Made here, as the Qt backend has to belong to the GUI thread
+            candidates = [backend() for backend in backends.values()]
+            self.on_capture_thread(partial(self.__calibrate_backends, candidates, self.monitors, topology))
+
+    def on_capture_thread(self, fn):
+        if self.captureWorker:
+            self.captureWorker.call(fn)
+        else:
+            self.__deferred.append(fn)
+
+    # Anything asked for before the worker was around is run first, ahead of any capture
+    def attach_capture_worker(self, worker):
+        self.captureWorker = worker
+
+        deferred, self.__deferred = self.__deferred, []
+        for fn in deferred:
+            worker.call(fn)
+
+    # These run on the capture thread, and what they return is run back on the GUI thread
+    def __switch_backend(self, backend, latency: float | None):
+        self.capture.set_backend(backend)
+        return partial(self.__backend_switched, latency)
+
+    def __calibrate_backends(self, candidates: list, monitors: list[dict], topology: str):
+        results = calibrate(candidates, monitors)
+
+        name = min(results, key=results.get, default="mss")
+        latency = results.get(name)
+
+        chosen = next(backend for backend in candidates if backend.name == name)
+        for backend in candidates:
+            if backend is not chosen:
+                backend.close()
+
+        self.capture.set_backend(chosen)
+        return partial(self.__backend_switched, latency, topology, name)
+
+    def __backend_switched(self, latency: float | None, topology: str = None, name: str = None):
+        self.captureLatency = latency
+
+        if topology is not None:
+            capture = self.settings.values["general"]["capture"]
+            capture["calibrated_topology"] = topology
+            capture["calibrated_backend"] = name
+            capture["calibrated_latency_ms"] = latency or 0
+            self.settings.save()
+
+    def add_to_history(self, shots: list[Frame]) -> int:
+        if self.library:
+            self.library.add(shots)
+
+        return self.history.add(shots)
+
+    # Adds a monitor grabbed later on to a lazy capture, as long as the entry is still around and uncompressed
+    def fill_history(self, id: int, monitor: int, frame: Frame) -> bool:
+        if not self.history.fill(id, monitor, frame):
+            return False
+
+        source = next((f.source for f in self.history[id] if f is not None and f.source), None)
+        if self.library and source:
+            self.library.add_monitor(source[0], monitor, frame)
+
+        return True
+
+    # Fill the history with the newest captures from the library. Only the metadata is read here,
+    # the images themselves are loaded when the entry is opened
+    def load_library_history(self):
+        if not self.library:
+            return
+
+        for capture in self.library.recent(self.settings.values["general"]["performance"]["history_max_items"]):
+            id = self.history.add_lazy(partial(self.library.load, capture), capture.timestamp, capture.captured())
+            self.history.set_thumbnail(id, capture.thumbnail_frame())
+
+    def apply_history_settings(self):
+        performance = self.settings.values["general"]["performance"]
+        self.history.configure(performance["history_max_items"], performance["history_budget_mb"],
+                               performance["history_hot_items"])
+        self.history.set_spill(SPILL_FILE if performance["history_spill"] else None, performance["history_spill_mb"])
 
     def check_refs(self):
         if self.settings.values["general"]["features"]["enable_discord"] and not self.discordRef:
@@ -80,6 +245,24 @@ class Utils:
             self.discordRef = Discord(self)
             print("Features: Discord reference created")
 
+        if self.settings.values["general"]["features"]["enable_library"] and not self.library:
+            from library import CaptureLibrary
+            self.library = CaptureLibrary(NEW_DIR)
+            print("Features: Capture library opened")
+        elif not self.settings.values["general"]["features"]["enable_library"] and self.library:
+            self.library.close()
+            self.library = None
+            print("Features: Capture library closed")
+
+        if self.settings.values["general"]["features"]["enable_hotkeys"] and not self.hotkeys:
+            from features.hotkeys import create_hotkey_listener
+            self.hotkeys = create_hotkey_listener(self.app_ref.platformName(), self.settings.values["hotkeys"])
+            print("Features: Hotkey listener created")
+        elif not self.settings.values["general"]["features"]["enable_hotkeys"] and self.hotkeys:
+            self.hotkeys.stop()
+            self.hotkeys = None
+            print("Features: Hotkey listener stopped")
+
     def generate_stylesheet(self) -> str:
         theme = self.current_theme
         try:
@@ -149,10 +332,26 @@ class Settings:
                 },
                 "features": {
                     "enable_opencv": False,
-                    "enable_discord": False
+                    "enable_discord": False,
+                    "enable_library": False,
+                    "enable_hotkeys": False,
+                    "enable_remote": True
                 },
                 "performance": {
-                    "history_max_items": 8
+                    "history_max_items": 8,
+                    "history_budget_mb": 1024,
+                    "history_hot_items": 1,
+                    "history_spill": False,
+                    "history_spill_mb": 2048
+                },
+                "capture": {
+                    "hide_mode": "wait",
+                    "hide_timeout_ms": 500,
+                    "capture_mode": "monitors",
+                    "backend": "auto",
+                    "calibrated_topology": "",
+                    "calibrated_backend": "",
+                    "calibrated_latency_ms": 0
                 }
             },
             "opencv": {
@@ -160,7 +359,13 @@ class Settings:
             },
             "discord": {
                 "username": "",
-                "webhooks": {}
+                "webhooks": {},
+                "upload_limit_mb": 10,
+                "groups": []
+            },
+            "hotkeys": {
+                "capture": "ctrl+alt+s",
+                "capture_region": "ctrl+alt+r"
             }
         }
 
@@ -254,14 +459,28 @@ def migrate_config(old: dict, new: dict) -> None:
                 new[k] = v
 
 
-def image_to_pixmap(image: Image, label: QtWidgets.QLabel, offset: QSize = QSize(0, 0),
-                    aspect: Qt.AspectRatioMode = Qt.AspectRatioMode.KeepAspectRatio,
-                    transform: Qt.TransformationMode = Qt.TransformationMode.SmoothTransformation) -> QPixmap:
-    return QPixmap.fromImage(image.toqimage()).scaled(
-        label.size() - offset,
-        aspect,
-        transform
-    )
+def paint_over(frame: Frame, monitor: dict, rect: tuple, backdrop: Frame = None) -> None:
+    left, top = max(rect[0], monitor["left"]), max(rect[1], monitor["top"])
+    right = min(rect[0] + rect[2], monitor["left"] + monitor["width"])
+    bottom = min(rect[1] + rect[3], monitor["top"] + monitor["height"])
+
+    if left >= right or top >= bottom:
+        return
+
+    frame.fill((left - monitor["left"], top - monitor["top"], right - monitor["left"], bottom - monitor["top"]),
+               backdrop)
+
+
+def clip_region(region: tuple, monitors: list[dict]) -> tuple | None:
+    left = max(region[0], min(m["left"] for m in monitors))
+    top = max(region[1], min(m["top"] for m in monitors))
+    right = min(region[0] + region[2], max(m["left"] + m["width"] for m in monitors))
+    bottom = min(region[1] + region[3], max(m["top"] + m["height"] for m in monitors))
+
+    if left >= right or top >= bottom:
+        return None
+
+    return left, top, right - left, bottom - top
 
 
 def get_all_themes() -> list[Theme]:
@@ -1,15 +1,21 @@
+import socket
 import time
+from collections import deque
 from functools import partial
 
 from PySide6 import QtGui
-from PySide6.QtCore import Qt, QEvent, QObject
-from PySide6.QtGui import QBrush, QColor
+from PySide6.QtCore import Qt, QEvent, QObject, QTimer, QPoint, QRect, QRectF, Signal
+from PySide6.QtGui import QBrush, QColor, QPainter, QPen
 from PySide6.QtWidgets import (QMessageBox, QSizePolicy, QSpacerItem, QPushButton, QVBoxLayout, QHBoxLayout, QLabel,
                                QTabWidget, QWidget, QFileDialog, QToolButton, QMenu, QComboBox, QSystemTrayIcon,
-                               QFrame, QRadioButton, QSpinBox, QCheckBox, QLineEdit, QMainWindow,
-                               QListWidget, QListWidgetItem, QDialogButtonBox)
+                               QFrame, QSpinBox, QCheckBox, QLineEdit, QMainWindow,
+                               QListWidget, QListWidgetItem, QDialogButtonBox, QScrollArea)
 
 from utils import *
+from history import MEGABYTE, is_captured
+from preview import PreviewCache, THUMBNAIL_SIZE
+from worker import CaptureWorker
+from features.hotkeys import LATENCY_TARGET_MS
 
 
 class SettingsTab(QTabWidget):
@@ -37,17 +43,22 @@ class SettingsCheckbox(QCheckBox):
 
 
 class SettingsSpinBox(QHBoxLayout):
-    def __init__(self, title: str = ..., utils: Utils = ..., keys: tuple | list = ...):
+    def __init__(self, title: str = ..., utils: Utils = ..., keys: tuple | list = ..., maximum: int = 99):
         super().__init__()
 
         self.keys = keys
-        tab, category, option = keys
 
         self.title = QLabel(title)
         self.spinBox = QSpinBox()
 
+        # Settings can be two (tab, option) or three (tab, category, option) levels deep
+        value = utils.settings.values
+        for key in keys:
+            value = value[key]
+
         self.spinBox.setMinimum(1)
-        self.spinBox.setValue(utils.settings.values[tab][category][option])
+        self.spinBox.setMaximum(maximum)
+        self.spinBox.setValue(value)
         self.spinBox.setMinimumWidth(80)
 
         self.layout().addWidget(self.title)
@@ -80,53 +91,197 @@ class SettingsLineEdit(QHBoxLayout):
         self.utils.settings.save()
 
 
-class ScreenshotCarouselButton(QRadioButton):
-    def __init__(self, value):
+class ScreenshotCarouselButton(QToolButton):
+    def __init__(self, value, timestamp: float = None):
         super().__init__()
 
+        self.setCheckable(True)
+        self.setAutoExclusive(True)
+        self.setIconSize(QSize(*THUMBNAIL_SIZE))
+        self.setFixedSize(THUMBNAIL_SIZE[0] + 8, THUMBNAIL_SIZE[1] + 8)
+        self.setText("")
+
+        self.assign(value, timestamp)
+
+    # Buttons are reused for new history entries rather than being recreated
+    def assign(self, value, timestamp: float = None):
         self.value = value
-        self.time = time.time()
+        self.time = timestamp or time.time()
 
-        self.setFixedSize(18, 18)
-        self.setText("")
+        self.setIcon(QIcon())
+        self.setToolTip(time.strftime("%H:%M:%S - %D", time.localtime(self.time)))
 
-        self.setToolTip(time.strftime("%H:%M:%S - %D"))
+    def set_thumbnail(self, thumbnail: QPixmap):
+        self.setIcon(QIcon(thumbnail))
 
     def event(self, e: QEvent) -> bool:
         super().event(e)
         if isinstance(e, QtGui.QMouseEvent) and e.type() is e.Type.MouseButtonRelease:
             print(f"Button Pressed: {self.value}")
-            self.parentWidget().topLevelWidget().goto_in_history(self.value)
+            self.window().goto_in_history(self.value)
         return False
 
 
-class ScreenshotCarouselGroup(QHBoxLayout):
+class ScreenshotCarouselGroup(QScrollArea):
     def __init__(self):
         super().__init__()
 
-        self.__buttonList: list[ScreenshotCarouselButton] = []
-        self.__buttonIndex = 0
+        # Visible buttons (oldest first), the same buttons by value, and hidden buttons waiting to be reused
+        self.__buttonList: deque[ScreenshotCarouselButton] = deque()
+        self.__buttons: dict[int, ScreenshotCarouselButton] = {}
+        self.__spareButtons: list[ScreenshotCarouselButton] = []
+
+        self.strip = QWidget()
+        self.strip.setLayout(QHBoxLayout())
+        self.strip.layout().setContentsMargins(0, 0, 0, 0)
+
+        self.strip.layout().addSpacerItem(QSpacerItem(40, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+        self.strip.layout().addSpacerItem(QSpacerItem(40, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+
+        self.setWidget(self.strip)
+        self.setWidgetResizable(True)
+        self.setFrameShape(QFrame.Shape.NoFrame)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setFixedHeight(THUMBNAIL_SIZE[1] + 8 + self.horizontalScrollBar().sizeHint().height())
+
+    def remove(self, ids: list[int]):
+        for id in ids:
+            button = self.__buttons.pop(id, None)
+
+            if button is not None:
+                self.__buttonList.remove(button)
+                self.strip.layout().removeWidget(button)
+                button.hide()
+                self.__spareButtons.append(button)
+
+    def add_new_button(self, max_btns, value, timestamp: float = None):
+        self.resize_pool(max_btns)
+
+        if len(self.__buttonList) >= max_btns:
+            button = self.__buttonList.popleft()
+            del self.__buttons[button.value]
+            self.strip.layout().removeWidget(button)
+            button.assign(value, timestamp)
+        elif self.__spareButtons:
+            button = self.__spareButtons.pop()
+            button.assign(value, timestamp)
+        else:
+            button = ScreenshotCarouselButton(value, timestamp)
+
+        self.__buttonList.append(button)
+        self.__buttons[value] = button
+
+        # Buttons go in between the two spacers
+        self.strip.layout().insertWidget(self.strip.layout().count() - 1, button)
+        button.show()
+        button.setChecked(True)
+
+        QTimer.singleShot(0, partial(self.ensureWidgetVisible, button))
+
+    # Only ever keep as many buttons around as there can be history entries
+    def resize_pool(self, max_btns):
+        while self.__spareButtons and len(self.__buttonList) + len(self.__spareButtons) > max_btns:
+            self.__spareButtons.pop().deleteLater()
+
+        while len(self.__buttonList) > max_btns:
+            button = self.__buttonList.popleft()
+            del self.__buttons[button.value]
+            self.strip.layout().removeWidget(button)
+            button.deleteLater()
+
+    def set_thumbnail(self, value, thumbnail: QPixmap):
+        if value in self.__buttons:
+            self.__buttons[value].set_thumbnail(thumbnail)
+
+    def set_checked(self, value):
+        if value in self.__buttons:
+            self.__buttons[value].setChecked(True)
+
+
+# Covers the whole desktop with the last capture (using its scaled down previews) so an area can be dragged out
+class RegionSelector(QWidget):
+    # (left, top, width, height) in device pixels
+    selected = Signal(tuple)
+
+    def __init__(self, monitors: list[dict], previews: list[QPixmap | None]):
+        super().__init__(None, Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint |
+                         Qt.WindowType.Tool)
+
+        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.setCursor(Qt.CursorShape.CrossCursor)
+        self.setMouseTracking(True)
+
+        self.monitors = monitors
+        self.previews = previews
+        self.ratio = QGuiApplication.primaryScreen().devicePixelRatio()
+
+        self.origin = QPoint(min(m["left"] for m in monitors), min(m["top"] for m in monitors))
+        right = max(m["left"] + m["width"] for m in monitors)
+        bottom = max(m["top"] + m["height"] for m in monitors)
+
+        self.setGeometry(QRect(round(self.origin.x() / self.ratio), round(self.origin.y() / self.ratio),
+                               round((right - self.origin.x()) / self.ratio),
+                               round((bottom - self.origin.y()) / self.ratio)))
+
+        self.start: QPoint | None = None
+        self.end: QPoint | None = None
 
-        self.layout().addSpacerItem(QSpacerItem(40, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
-        self.update_widget()
-        self.layout().addSpacerItem(QSpacerItem(40, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+    def selection(self) -> QRect | None:
+        if self.start is None:
+            return None
+        return QRect(self.start, self.end).normalized()
 
-    def add_new_button(self, max_btns):
-        self.__buttonList.append(ScreenshotCarouselButton(self.__buttonIndex))
-        self.__buttonIndex += 1
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        painter = QPainter(self)
 
-        if len(self.__buttonList) > max_btns:
-            self.layout().removeWidget(self.__buttonList[0])
-            del self.__buttonList[0]
-        self.update_widget()
-        self.set_checked(len(self.__buttonList) - 1)
+        self.paint_previews(painter)
+        painter.fillRect(self.rect(), QColor(0, 0, 0, 110))
 
-    def update_widget(self):
-        [self.layout().addWidget(b) for b in self.__buttonList]
+        selection = self.selection()
+        if selection is not None:
+            painter.setClipRect(selection)
+            self.paint_previews(painter)
+            painter.setClipping(False)
 
-    def set_checked(self, index):
-        for i, b in enumerate(self.__buttonList):
-            b.setChecked(True if i == index else False)
+            painter.setPen(QPen(QColor(85, 255, 127), 1))
+            painter.drawRect(selection.adjusted(0, 0, -1, -1))
+
+        painter.end()
+
+    def paint_previews(self, painter: QPainter):
+        for monitor, preview in zip(self.monitors, self.previews):
+            if preview is None:
+                continue
+
+            painter.drawPixmap(QRectF((monitor["left"] - self.origin.x()) / self.ratio,
+                                      (monitor["top"] - self.origin.y()) / self.ratio,
+                                      monitor["width"] / self.ratio, monitor["height"] / self.ratio),
+                               preview, QRectF(preview.rect()))
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent) -> None:
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.start = self.end = event.position().toPoint()
+            self.update()
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent) -> None:
+        if self.start is not None:
+            self.end = event.position().toPoint()
+            self.update()
+
+    def mouseReleaseEvent(self, event: QtGui.QMouseEvent) -> None:
+        selection = self.selection()
+        self.close()
+
+        if selection is not None and selection.width() > 2 and selection.height() > 2:
+            self.selected.emit((round(selection.x() * self.ratio) + self.origin.x(),
+                                round(selection.y() * self.ratio) + self.origin.y(),
+                                round(selection.width() * self.ratio), round(selection.height() * self.ratio)))
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent) -> None:
+        if event.key() == Qt.Key.Key_Escape:
+            print("Region: Selection cancelled")
+            self.close()
 
 
 class HLine(QFrame):
@@ -206,6 +361,12 @@ class ListEditor(QWidget):
         )
 
         if confirmation == QMessageBox.StandardButton.Ok:
+            webhook = self.utils.settings.values["discord"]["webhooks"][self.list.selectedIndexes()[0].row()]
+
+            for group in self.utils.settings.values["discord"]["groups"]:
+                if webhook.name in group["webhooks"]:
+                    group["webhooks"].remove(webhook.name)
+
             del self.utils.settings.values["discord"]["webhooks"][self.list.selectedIndexes()[0].row()]
             self.list.takeItem(self.list.indexFromItem(self.list.selectedItems()[0]).row())
 
@@ -310,6 +471,12 @@ class WebhookEditor(QMainWindow):
             _settings.save()
         else:
             self.listItem.setText(self.name.text() + f" [{self.url.text()}]")
+
+            # Groups refer to webhooks by name
+            for group in _settings.values["discord"]["groups"]:
+                group["webhooks"] = [self.name.text() if name == self.webhook.name else name
+                                     for name in group["webhooks"]]
+
             _settings.values["discord"]["webhooks"][_list.indexFromItem(self.listItem).row()] = Webhook(
                 self.name.text(), self.url.text(), self.username.text()
             )
@@ -327,6 +494,193 @@ class WebhookEditor(QMainWindow):
         return True
 
 
+class GroupListEditor(QWidget):
+    def __init__(self, utils: Utils = ...):
+        super().__init__()
+
+        self.utils = utils
+
+        self.setLayout(QHBoxLayout())
+
+        self.list = QListWidget()
+        self.list.itemSelectionChanged.connect(self.on_selection_changed)
+        self.list.itemDoubleClicked.connect(self.edit_group)
+
+        for group in utils.settings.values["discord"]["groups"]:
+            self.list.addItem(self.describe(group))
+
+        self.buttonGroup = QVBoxLayout()
+
+        self.addButton = QPushButton("Add Group")
+        self.addButton.clicked.connect(self.add_new_group)
+
+        self.editButton = QPushButton("Edit Group")
+        self.editButton.clicked.connect(self.edit_group)
+
+        self.deleteButton = QPushButton("Delete Group")
+        self.deleteButton.clicked.connect(self.delete_group)
+
+        self.buttons = [self.addButton, self.editButton, self.deleteButton]
+        [b.setDisabled(True) for b in self.buttons[1:]]
+
+        [self.buttonGroup.addWidget(w) for w in self.buttons]
+        self.buttonGroup.addStretch(1)
+
+        self.layout().addWidget(self.list)
+        self.layout().addLayout(self.buttonGroup)
+
+    @staticmethod
+    def describe(group: dict) -> str:
+        return f"{group['name']} [{', '.join(group['webhooks'])}]"
+
+    def add_new_group(self):
+        editor = GroupEditor(self)
+        editor.show()
+
+    def edit_group(self):
+        if not self.list.selectedItems():
+            return
+
+        row = self.list.indexFromItem(self.list.selectedItems()[0]).row()
+
+        editor = GroupEditor(self, self.utils.settings.values["discord"]["groups"][row], row)
+        editor.show()
+
+    def delete_group(self):
+        row = self.list.indexFromItem(self.list.selectedItems()[0]).row()
+
+        del self.utils.settings.values["discord"]["groups"][row]
+        self.list.takeItem(row)
+        self.utils.settings.save()
+
+    def refresh(self):
+        self.list.clear()
+
+        for group in self.utils.settings.values["discord"]["groups"]:
+            self.list.addItem(self.describe(group))
+
+    def on_selection_changed(self):
+        [b.setDisabled(len(self.list.selectedItems()) == 0) for b in self.buttons[1:]]
+
+
+class GroupEditor(QMainWindow):
+    def __init__(self, parent: GroupListEditor, group: dict = None, row: int = None):
+        super(GroupEditor, self).__init__(parent)
+
+        self.setWindowTitle("Edit Webhook Group" if group else "Add New Webhook Group")
+        self.setWindowFlags(Qt.WindowType.Dialog)
+
+        self.parent = parent
+        self.group = group
+        self.row = row
+
+        self.widget = QWidget()
+        self.layout = QVBoxLayout()
+
+        self.widget.setLayout(self.layout)
+
+        self.layout.addWidget(QLabel("Group Name*"))
+
+        self.name = QLineEdit()
+        self.name.setText(group["name"]) if group else ...
+        self.layout.addWidget(self.name)
+
+        self.layout.addWidget(QLabel("Webhooks*"))
+
+        self.webhooks = QListWidget()
+
+        for webhook in parent.utils.settings.values["discord"]["webhooks"]:
+            item = QListWidgetItem(webhook.name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if group and webhook.name in group["webhooks"]
+                               else Qt.CheckState.Unchecked)
+            self.webhooks.addItem(item)
+
+        self.layout.addWidget(self.webhooks)
+
+        self.dialogButtons = QDialogButtonBox(self.widget)
+        self.dialogButtons.setStandardButtons(QDialogButtonBox.StandardButton.Ok |
+                                              QDialogButtonBox.StandardButton.Cancel)
+
+        self.dialogButtons.accepted.connect(self.on_accepted)
+        self.dialogButtons.rejected.connect(self.close)
+        self.layout.addWidget(self.dialogButtons)
+
+        self.setCentralWidget(self.widget)
+
+    def on_accepted(self):
+        webhooks = [self.webhooks.item(i).text() for i in range(self.webhooks.count())
+                    if self.webhooks.item(i).checkState() == Qt.CheckState.Checked]
+
+        if self.name.text() == "" or not webhooks:
+            QMessageBox.critical(self, "Error in fields", "A group needs a name and at least one webhook",
+                                 QMessageBox.StandardButton.Ok)
+            return
+
+        groups = self.parent.utils.settings.values["discord"]["groups"]
+        group = {"name": self.name.text(), "webhooks": webhooks}
+
+        if self.row is None:
+            groups.append(group)
+        else:
+            groups[self.row] = group
+
+        self.parent.utils.settings.save()
+        self.parent.refresh()
+
+        self.close()
+
+
+# Shows how each upload of a group send is getting on
+class UploadStatusWindow(QMainWindow):
+    def __init__(self, parent, uploads, group: str, ids: dict[int, str]):
+        super(UploadStatusWindow, self).__init__(parent)
+
+        self.setWindowTitle(f"Sending to {group}")
+        self.setWindowFlags(Qt.WindowType.Dialog)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+
+        self.uploads = uploads
+        self.names = ids
+        self.remaining = set(ids)
+
+        self.list = QListWidget()
+        self.items: dict[int, QListWidgetItem] = {}
+
+        for id, name in ids.items():
+            self.items[id] = QListWidgetItem(f"{name}: Queued")
+            self.list.addItem(self.items[id])
+
+        self.setCentralWidget(self.list)
+
+        uploads.progress.connect(self.on_progress)
+        uploads.finished.connect(self.on_finished)
+
+    def on_progress(self, id: int, message: str):
+        if id in self.items:
+            self.set_status(id, message)
+
+    def on_finished(self, id: int, ok: bool, rejected: bool, message: str):
+        if id not in self.items:
+            return
+
+        self.set_status(id, message)
+        self.items[id].setForeground(QColor("#4caf50" if ok else "#f44336"))
+
+        self.remaining.discard(id)
+        if not self.remaining:
+            self.setWindowTitle(self.windowTitle().replace("Sending to", "Sent to"))
+
+    def set_status(self, id: int, message: str):
+        self.items[id].setText(f"{self.names[id]}: {message}")
+
+    def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        self.uploads.progress.disconnect(self.on_progress)
+        self.uploads.finished.disconnect(self.on_finished)
+
+        super().closeEvent(event)
+
+
 class MainWindow(QMainWindow):
     def __init__(self, parent=None, utils: Utils = ...):
         super(MainWindow, self).__init__(parent)
@@ -344,6 +698,37 @@ class MainWindow(QMainWindow):
 
         self.screenshots = []
         self.currentMonitor = 0
+        self.currentEntry = None
+
+        # The newest capture of every monitor, which the region selector shows
+        self.lastMonitorsEntry = None
+
+        # In lazy mode, the capture whose missing monitors still get grabbed when they are switched to
+        self.lazyEntry = None
+        self.regionSelector = None
+
+        # fill is the lazy capture entry that a single monitor capture belongs in,
+        # remote captures (asked for over the control socket) leave the window where it is
+        # and hotkey is when the hotkey behind a capture was pressed (time.perf_counter)
+        self.captureWorker = CaptureWorker(self.utils.capture_monitors, self.utils.prepare_capture,
+                                           ("fill", "remote", "hotkey"))
+        self.captureWorker.captured.connect(self.on_screenshots_captured)
+        self.captureWorker.failed.connect(self.on_capture_failed)
+        self.captureWorker.returned.connect(self.on_capture_call_returned)
+        self.utils.attach_capture_worker(self.captureWorker)
+        self.captureWorker.warm_up()
+
+        self.connect_hotkeys()
+
+        self.control = None
+        self.update_control_server()
+
+        # Used when waiting for the window manager to hide Screpo before capturing
+        self.hidingForCapture = False
+        self.pendingCapture = {}
+        self.hideTimer = QTimer(self)
+        self.hideTimer.setSingleShot(True)
+        self.hideTimer.timeout.connect(partial(self.on_window_hidden, True))
 
         self.setWindowTitle("Screpo")
         self.setWindowIcon(self.utils.desktopIcon)
@@ -354,7 +739,8 @@ class MainWindow(QMainWindow):
         self.tray.activated.connect(self.showNormal)
 
         self.tray_menu = QMenu()
-        self.tray_menu.addAction("Capture New Screenshot", self.update_screenshots)
+        self.tray_menu.addAction("Capture New Screenshot", partial(self.update_screenshots, True))
+        self.tray_menu.addAction("Capture Region", self.select_region)
         self.tray_menu.addSeparator()
         self.tray_menu.addAction("Exit Screpo", self.close)
 
@@ -366,18 +752,39 @@ class MainWindow(QMainWindow):
         self.imageHolder = QLabel(self)
         self.imageHolder.setFixedSize(525, 525)
 
+        self.previews = PreviewCache(self.imageHolder.size())
+        self.previews.ready.connect(self.on_preview_ready)
+        self.previews.thumbnailReady.connect(self.on_thumbnail_ready)
+
         self.imageSwitcher = ScreenshotCarouselGroup()
 
         self.imageAndButtons.addWidget(self.imageHolder)
         self.imageAndButtons.addWidget(QLabel("History"))
         self.imageAndButtons.addWidget(HLine())
-        self.imageAndButtons.addLayout(self.imageSwitcher)
+        self.imageAndButtons.addWidget(self.imageSwitcher)
 
-        self.windowOptions = {i: [f"{''.join(['Monitor ', str(i + 1) + ': ']) if len(self.utils.monitors) > 1 else ''}"
-                                  f"Whole Monitor"] for i in range(len(self.utils.monitors))}
+        self.windowOptions = {}
+        self.update_window_options()
 
         self.windowSelector = QComboBox(self)
-        self.windowSelector.addItems(self.windowOptions[0])
+        self.windowSelector.setSizeAdjustPolicy(QComboBox.SizeAdjustPolicy.AdjustToMinimumContentsLengthWithIcon)
+        self.windowSelector.activated.connect(self.on_window_selected)
+        self.update_window_selector()
+
+        # Windows opening, closing and moving can come in bursts, so the list is only rebuilt once they settle down
+        self.windowRefreshTimer = QTimer(self)
+        self.windowRefreshTimer.setSingleShot(True)
+        self.windowRefreshTimer.setInterval(250)
+        self.windowRefreshTimer.timeout.connect(self.update_window_selector)
+
+        if self.utils.windowIndex:
+            self.utils.windowIndex.changed.connect(self.windowRefreshTimer.start)
+
+        # Anything already in the history (from the capture library) gets a button before the first capture
+        for id in self.utils.history.keys():
+            self.imageSwitcher.add_new_button(self.utils.settings.values["general"]["performance"]["history_max_items"],
+                                              id, self.utils.history.timestamp(id))
+            self.on_thumbnail_ready(id)
 
         self.monitorButtonLayout = QHBoxLayout()
         self.update_screenshots()
@@ -406,11 +813,15 @@ class MainWindow(QMainWindow):
             QIcon(r":/icons/discord-white"),
             "Send to Webhook w/ Message"
         )
+        self.saveImageMenu.addAction(
+            QIcon(r":/icons/discord-white"),
+            "Send All Monitors to Webhook"
+        )
 
         for action in self.saveImageMenu.actions():
             action.setDisabled(not self.utils.settings.values["general"]["features"]["enable_discord"])
 
-        for index, action in enumerate(self.saveImageMenu.actions()):
+        for index, action in enumerate(self.saveImageMenu.actions()[:3]):
             if len(self.utils.settings.values["discord"]["webhooks"]) == 0:
                 action.setDisabled(True)
                 continue
@@ -431,22 +842,44 @@ class MainWindow(QMainWindow):
                         webhook,
                         self.get_current_screenshot
                     ))
+                elif index == 2:
+                    menu.addAction(webhook.name, partial(
+                        self.utils.discordRef.send_all_to_webhook,
+                        webhook,
+                        self.get_current_screenshots
+                    ))
 
             action.setMenu(menu)
 
+        self.sendToGroupAction = self.saveImageMenu.addAction(
+            QIcon(r":/icons/discord-white"),
+            "Send to Webhook Group"
+        )
+        self.update_group_menu()
+
         self.saveImageButton.setMenu(self.saveImageMenu)
 
+        self.connectedUploads = None
+        self.connect_uploads()
+
         self.imageButtonLayout.addWidget(self.copyImageButton)
         self.imageButtonLayout.addWidget(self.saveImageButton)
 
-        if len(self.screenshots) > 1:
-            for mon in range(len(self.screenshots)):
-                btn = QPushButton(f"Monitor &{mon + 1}", self)
-                btn.clicked.connect(partial(self.switch_screenshot, mon))
+        self.update_monitor_buttons()
+        self.update_button_colours()
 
-                self.monitorButtonLayout.layout().addWidget(btn)
+        # Monitors being plugged in, unplugged or rearranged tend to come in bursts
+        self.screensChangedTimer = QTimer(self)
+        self.screensChangedTimer.setSingleShot(True)
+        self.screensChangedTimer.setInterval(500)
+        self.screensChangedTimer.timeout.connect(self.on_screens_changed)
 
-        self.update_button_colours()
+        app = QtGui.QGuiApplication.instance()
+        app.screenAdded.connect(self.on_screen_added)
+        app.screenRemoved.connect(self.screensChangedTimer.start)
+
+        for screen in app.screens():
+            screen.geometryChanged.connect(self.screensChangedTimer.start)
 
         self.getScreenshotButton = QPushButton("Get &New Screenshot", self)
         self.getScreenshotButton.clicked.connect(self.update_screenshots)
@@ -458,8 +891,11 @@ class MainWindow(QMainWindow):
         self.settingsButton.setMaximumSize(24, 24)
         self.settingsButton.setToolTip("Settings")
 
-        self.miscButton = QPushButton("Dunno atm")
+        self.miscButton = QPushButton("Capture Region")
         self.miscButton.setMaximumSize(24, 24)
+        self.miscButton.setToolTip("Capture Region")
+        self.miscButton.clicked.connect(self.select_region)
+        self.miscButton.setShortcut(QtGui.QKeySequence("Ctrl+R"))
 
         self.miscBottomButtons = QVBoxLayout()
         self.miscBottomButtons.addWidget(self.miscButton)
@@ -473,7 +909,7 @@ class MainWindow(QMainWindow):
         self.layout = QVBoxLayout(self.widget)
         self.layout.addLayout(self.imageAndButtons)
         self.layout.addWidget(self.windowSelector)
-        if len(self.utils.monitors) > 1: self.layout.addLayout(self.monitorButtonLayout)
+        self.layout.addLayout(self.monitorButtonLayout)
         self.layout.addLayout(self.imageButtonLayout)
         self.layout.addLayout(self.bottomLayout)
 
@@ -490,8 +926,12 @@ class MainWindow(QMainWindow):
 
     def eventFilter(self, watched: QObject, event: QEvent) -> bool:
         super().eventFilter(watched, event)
-        
-        if event.type() == QEvent.Type.KeyPress:
+
+        if watched is self.windowHandle():
+            # The window system has actually unmapped the window once it stops being exposed
+            if event.type() == QEvent.Type.Expose and self.hidingForCapture and not watched.isExposed():
+                self.on_window_hidden()
+        elif event.type() == QEvent.Type.KeyPress:
             if event.key() == Qt.Key.Key_Shift:
                 self.getScreenshotButton.setText("Instantly Get New Screenshot")
                 self.instant = True
@@ -505,10 +945,12 @@ class MainWindow(QMainWindow):
     def update(self) -> None:
         super().update()
 
+        self.connect_uploads()
+
         for action in self.saveImageMenu.actions():
             action.setDisabled(not self.utils.settings.values["general"]["features"]["enable_discord"])
 
-        for index, action in enumerate(self.saveImageMenu.actions()):
+        for index, action in enumerate(self.saveImageMenu.actions()[:3]):
             if len(self.utils.settings.values["discord"]["webhooks"]) == 0:
                 action.setDisabled(True)
                 continue
@@ -529,43 +971,415 @@ class MainWindow(QMainWindow):
                         webhook,
                         self.get_current_screenshot
                     ))
+                elif index == 2:
+                    menu.addAction(webhook.name, partial(
+                        self.utils.discordRef.send_all_to_webhook,
+                        webhook,
+                        self.get_current_screenshots
+                    ))
 
             action.setMenu(menu)
 
+        self.update_group_menu()
+
+    def update_group_menu(self):
+        groups = self.utils.settings.values["discord"]["groups"]
+
+        self.sendToGroupAction.setDisabled(
+            not self.utils.settings.values["general"]["features"]["enable_discord"] or len(groups) == 0)
+
+        menu = QMenu()
+
+        for group in groups:
+            menu.addAction(group["name"], partial(self.send_to_group, group))
+
+        self.sendToGroupAction.setMenu(menu)
+
+    def send_to_group(self, group: dict):
+        ids = self.utils.discordRef.send_to_group(group, self.get_current_screenshot)
+
+        if ids:
+            status = UploadStatusWindow(self, self.utils.discordRef.uploads, group["name"], ids)
+            status.show()
+
     def update_current_screenshot(self):
-        self.imageHolder.setPixmap(
-            image_to_pixmap(self.get_current_screenshot(), self.imageHolder)
-        )
+        if not self.screenshots or self.currentEntry is None:
+            return
+
+        if self.currentMonitor < len(self.screenshots) and not is_captured(self.screenshots, self.currentMonitor):
+            self.imageHolder.setText("Capturing..." if self.currentEntry == self.lazyEntry
+                                     else "This monitor wasn't captured")
+            return
+
+        pixmap = self.previews.get(self.currentEntry, self.currentMonitor)
+
+        # If the preview isn't ready yet it gets shown by on_preview_ready once it is
+        if pixmap is not None:
+            self.imageHolder.setPixmap(pixmap)
+        else:
+            self.previews.request(self.currentEntry, self.screenshots)
+
+    def on_preview_ready(self, id: int, monitor: int):
+        if (id, monitor) == (self.currentEntry, self.currentMonitor):
+            self.imageHolder.setPixmap(self.previews.get(id, monitor))
+
+    def on_thumbnail_ready(self, id: int):
+        thumbnail = self.utils.history.thumbnail(id)
+
+        if thumbnail is not None:
+            self.imageSwitcher.set_thumbnail(id, QPixmap.fromImage(thumbnail.to_qimage()))
 
     def switch_screenshot(self, mon):
         self.currentMonitor = mon
         self.update_current_screenshot()
+        self.update_window_selector()
+        self.update_button_colours()
+
+        self.capture_missing_monitor()
+
+    # Lazy captures only grab the monitor being looked at, the others are grabbed the first time they are switched
+    # to (until the next capture comes along)
+    def capture_missing_monitor(self):
+        if (self.currentEntry is not None and self.currentEntry == self.lazyEntry and
+                self.currentMonitor < len(self.screenshots) and not is_captured(self.screenshots, self.currentMonitor)):
+            self.request_capture(only=self.currentMonitor, fill=self.currentEntry)
+
+    # Whole Monitor followed by every window on the current monitor, keeping the selected window selected
+    def update_window_selector(self):
+        selected = self.windowSelector.currentData()
 
         self.windowSelector.clear()
-        self.windowSelector.addItems(self.windowOptions[mon])
+        self.windowSelector.addItems(self.windowOptions[self.currentMonitor])
 
-        self.update_button_colours()
+        if not self.utils.windowIndex:
+            return
+
+        monitor = (self.utils.monitors[self.currentMonitor] if self.currentMonitor < len(self.utils.monitors)
+                   else self.utils.desktop)
+        windows = self.utils.windowIndex.windows_on(monitor, {int(self.winId())})
+
+        # A selected window that has moved to another monitor is still the one that gets captured
+        tracked = self.utils.windowIndex.get(selected) if selected is not None else None
+        if tracked and tracked.mapped and tracked not in windows:
+            windows.append(tracked)
+
+        for window in windows:
+            self.windowSelector.addItem(window.title, window.id)
+
+            if window.id == selected:
+                self.windowSelector.setCurrentIndex(self.windowSelector.count() - 1)
+
+    def on_window_selected(self, index: int):
+        if self.windowSelector.itemData(index) is not None:
+            self.update_screenshots()
+
+    # Instant captures paint over Screpo rather than waiting for it to hide
+    def update_screenshots(self, instant: bool = False, **options):
+        window = self.windowSelector.currentData()
+
+        if window is not None:
+            self.request_capture(instant, window=window, **options)
+        elif self.settingsObj.values["general"]["capture"]["capture_mode"] == "lazy":
+            self.request_capture(instant, only=min(self.currentMonitor, len(self.utils.monitors) - 1), **options)
+        else:
+            self.request_capture(instant, **options)
+
+    def connect_hotkeys(self):
+        if self.utils.hotkeys:
+            self.utils.hotkeys.triggered.connect(self.on_hotkey)
+
+    # Starts or stops the control socket other programs (and other launches of Screpo) use
+    def update_control_server(self):
+        enabled = self.settingsObj.values["general"]["features"]["enable_remote"] and hasattr(socket, "AF_UNIX")
+
+        if enabled and not self.control:
+            from control import ControlServer
+
+            self.control = ControlServer(self.utils.history)
+            self.control.captureRequested.connect(self.on_remote_capture)
+            self.control.activateRequested.connect(self.on_remote_activate)
+        elif not enabled and self.control:
+            self.control.close()
+            self.control = None
+
+    def on_remote_capture(self, options: dict):
+        self.request_capture(True, remote=True, **options)
+
+    def on_remote_activate(self):
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        self.update_screenshots()
+
+    # The Discord reference (and its upload queue) only exists once Discord features are turned on
+    def connect_uploads(self):
+        uploads = self.utils.discordRef.uploads if self.utils.discordRef else None
+
+        if uploads is not None and uploads is not self.connectedUploads:
+            uploads.progress.connect(self.on_upload_progress)
+            uploads.finished.connect(self.on_upload_finished)
+            self.utils.discordRef.outbox.failed.connect(self.on_upload_failed)
+            self.connectedUploads = uploads
+
+    def on_upload_progress(self, id: int, message: str):
+        self.saveImageButton.setToolTip(f"Upload {id}: {message}")
+        self.update_upload_status()
+
+    def on_upload_finished(self, id: int, ok: bool, rejected: bool, message: str):
+        self.saveImageButton.setToolTip(f"Upload {id}: {message}")
+        self.update_upload_status()
+
+    def on_upload_failed(self, id: int, webhook: str, message: str, kept: bool):
+        if kept:
+            text = f"Couldn't send to {webhook} yet ({message}). It will be sent again later"
+        else:
+            text = f"Sending to {webhook} failed: {message}"
+
+        self.tray.showMessage("Screpo", text, QSystemTrayIcon.MessageIcon.Warning)
 
-    def update_screenshots(self):
-        if not self.instant or not self.windowState() & Qt.WindowState.WindowMinimized:
-            self.window().showMinimized()
-            time.sleep(.285)
+    def update_upload_status(self):
+        active = self.connectedUploads.active()
+        self.saveImageButton.setText(f"Save Image ({active} sending)" if active else "Save Image")
 
-        self.screenshots = self.utils.capture_monitors()
+    def on_hotkey(self, action: str, pressed: float):
+        if action == "capture":
+            # Goes along with the request, so a hotkey merged into another capture isn't timed at all
+            self.update_screenshots(True, hotkey=pressed)
+        elif action == "capture_region":
+            self.select_region()
+
+    def select_region(self):
+        if self.regionSelector:
+            return
+
+        previews = [self.previews.get(self.lastMonitorsEntry, i) if self.lastMonitorsEntry is not None else None
+                    for i in range(len(self.utils.monitors))]
+
+        self.regionSelector = RegionSelector(self.utils.monitors, previews)
+        self.regionSelector.selected.connect(self.on_region_selected)
+        self.regionSelector.destroyed.connect(self.on_region_selector_closed)
+        self.regionSelector.show()
+        self.regionSelector.activateWindow()
+
+    def on_region_selector_closed(self, *args):
+        self.regionSelector = None
+
+    def on_region_selected(self, region: tuple):
+        print(f"Region: Capturing {region[2]}x{region[3]} at ({region[0]}, {region[1]})")
+        self.request_capture(region=region)
+
+    def request_capture(self, instant: bool = False, **options):
+        if self.hidingForCapture or self.captureWorker.is_busy():
+            print("Capture: Request coalesced into the pending capture")
+            return
+
+        if not self.isVisible() or self.isMinimized():
+            self.captureWorker.request(**options)
+            return
+
+        capture = self.settingsObj.values["general"]["capture"]
+        composite = instant or self.instant or capture["hide_mode"] == "composite"
+
+        # Painting over Screpo only works when every monitor is captured.
+        # Remote captures never hide the window though, so their regions have it blanked out instead
+        if (composite and not ("region" in options or "window" in options)) or options.get("remote"):
+            self.captureWorker.request(exclude=self.get_window_rect(), backdrop=self.screenshots, **options)
+            return
+
+        self.hidingForCapture = True
+        self.pendingCapture = options
+        self.windowHandle().installEventFilter(self)
+        self.hideTimer.start(capture["hide_timeout_ms"])
+
+        self.window().showMinimized()
+
+    def on_window_hidden(self, timed_out: bool = False):
+        if not self.hidingForCapture:
+            return
+
+        if timed_out:
+            print("Capture: Timed out waiting for the window to hide, capturing anyway")
+
+        self.hidingForCapture = False
+        self.hideTimer.stop()
+
+        self.captureWorker.request(**self.pendingCapture)
+
+    # The area covered by the window (including decorations) in device pixels
+    def get_window_rect(self) -> tuple:
+        geometry = self.frameGeometry()
+        ratio = self.devicePixelRatioF()
+
+        return (round(geometry.x() * ratio), round(geometry.y() * ratio),
+                round(geometry.width() * ratio), round(geometry.height() * ratio))
+
+    def on_screenshots_captured(self, shots: list, options: dict):
+        if "fill" in options:
+            self.on_monitor_captured(options["fill"], options["only"], shots[options["only"]], options)
+            return
+
+        if "hotkey" in options:
+            self.log_hotkey_latency(options["hotkey"])
+
+        id = self.utils.add_to_history(shots)
+
+        # Only captures made from the window get their other monitors filled in later
+        if not options.get("remote"):
+            self.lazyEntry = id if "only" in options else None
+        self.screenshots = shots
+        self.currentEntry = id
+
+        if not ("region" in options or "window" in options):
+            self.lastMonitorsEntry = id
+
+        self.clamp_current_monitor()
+
+        self.previews.request(id, shots)
+
+        thumbnail = shots[self.currentMonitor] if self.currentMonitor < len(shots) else None
+        if thumbnail is not None:
+            self.previews.request_thumbnail(id, thumbnail, self.utils.history)
 
         self.update_current_screenshot()
 
         self.update_button_colours()
-        self.imageSwitcher.add_new_button(self.utils.settings.values["general"]["performance"]["history_max_items"])
+        self.imageSwitcher.add_new_button(self.utils.settings.values["general"]["performance"]["history_max_items"], id)
+        self.sync_history()
 
-        self.showNormal()
+        if self.control:
+            self.control.captured(id, shots)
+
+        if not options.get("remote"):
+            self.showNormal()
+
+    def log_hotkey_latency(self, pressed: float):
+        latency = (self.captureWorker.grabbed_at - pressed) * 1000
+
+        print(f"Hotkeys: {latency:.1f} ms from key press to pixels"
+              f"{f' (over the {LATENCY_TARGET_MS} ms target)' if latency > LATENCY_TARGET_MS else ''}")
+
+    # Remote captures that were merged into this one are answered with the whole entry
+    def on_monitor_captured(self, id: int, monitor: int, frame: Frame, options: dict):
+        if self.utils.fill_history(id, monitor, frame):
+            if self.currentEntry == id:
+                self.screenshots = self.utils.history[id].copy()
+
+            self.previews.request(id, self.utils.history[id])
+
+            if self.control:
+                self.control.captured(id, self.utils.history[id])
+        else:
+            print(f"History: Entry {id} can't take any more monitors, throwing away the capture of monitor {monitor}")
+
+            if self.lazyEntry == id:
+                self.lazyEntry = None
+
+            if self.control:
+                self.control.capture_failed("the capture was thrown away before it could be kept, try again")
+
+        self.update_current_screenshot()
+
+        if not options.get("remote"):
+            self.showNormal()
+
+    def on_capture_failed(self, error: str, options: dict):
+        if self.control:
+            self.control.capture_failed(error)
+
+        if not options.get("remote"):
+            self.showNormal()
 
     def goto_in_history(self, pos):
-        self.screenshots = self.utils.history[pos].copy()
+        if pos not in self.utils.history:
+            print(f"History: Entry {pos} is no longer available")
+            self.sync_history()
+            return
+
+        # Cold entries aren't rebuilt until something needs their frames, previews come from the cache
+        self.screenshots = self.utils.history.frames(pos)
+        self.currentEntry = pos
+
+        self.clamp_current_monitor()
         self.update_current_screenshot()
 
+    # Region and window captures only have a single image, so make sure the monitor being looked at exists.
+    # The window list is left alone so the selected window stays selected
+    def clamp_current_monitor(self):
+        if self.currentMonitor >= len(self.screenshots):
+            self.currentMonitor = 0
+            self.update_button_colours()
+
+    # Forget about anything the history has dropped
+    def sync_history(self):
+        dropped = self.utils.history.drain_dropped()
+
+        if dropped:
+            self.imageSwitcher.remove(dropped)
+            self.previews.discard(dropped)
+
+    def update_window_options(self):
+        self.windowOptions = {i: [f"{''.join(['Monitor ', str(i + 1) + ': ']) if len(self.utils.monitors) > 1 else ''}"
+                                  f"Whole Monitor"] for i in range(len(self.utils.monitors))}
+
+        # Whole desktop captures have the desktop as an extra image after the monitors
+        self.windowOptions[len(self.utils.monitors)] = ["Whole Desktop"]
+
+    def update_monitor_buttons(self):
+        while self.monitorButtonLayout.count():
+            self.monitorButtonLayout.takeAt(0).widget().deleteLater()
+
+        if len(self.utils.monitors) > 1:
+            for mon in range(len(self.utils.monitors)):
+                btn = QPushButton(f"Monitor &{mon + 1}", self)
+                btn.clicked.connect(partial(self.switch_screenshot, mon))
+
+                self.monitorButtonLayout.layout().addWidget(btn)
+
+            btn = QPushButton("&Desktop", self)
+            btn.setToolTip("Only available when capturing the whole desktop at once")
+            btn.clicked.connect(partial(self.switch_screenshot, len(self.utils.monitors)))
+            self.monitorButtonLayout.layout().addWidget(btn)
+
+    # Finishes off on the GUI thread whatever was run on the capture thread, like picking a new backend
+    def on_capture_call_returned(self, then):
+        then()
+
+        if self.settingsWidget and BUILD == BuildType.DEVELOPMENT:
+            self.settingsWidget.update_capture_backend()
+
+    def on_screen_added(self, screen: QtGui.QScreen):
+        screen.geometryChanged.connect(self.screensChangedTimer.start)
+        self.screensChangedTimer.start()
+
+    def on_screens_changed(self):
+        was_multi = len(self.utils.monitors) > 1
+
+        if not self.utils.refresh_monitors():
+            return
+
+        # Older captures don't line up with the new monitors any more
+        self.lastMonitorsEntry = None
+        self.lazyEntry = None
+
+        self.update_window_options()
+        self.update_monitor_buttons()
+        self.captureWorker.warm_up()
+
+        # Make room for the monitor buttons (or stop leaving room for them)
+        is_multi = len(self.utils.monitors) > 1
+        if is_multi != was_multi:
+            self.setFixedHeight(self.height() + (45 if is_multi else -45))
+
+        if self.currentMonitor > len(self.utils.monitors):
+            self.currentMonitor = 0
+
+        self.clamp_current_monitor()
+        self.update_current_screenshot()
+        self.update_window_selector()
+        self.update_button_colours()
+
     def update_button_colours(self):
-        if len(self.screenshots) > 1:
+        if len(self.utils.monitors) > 1:
             for i, btn in enumerate([self.monitorButtonLayout.itemAt(i)
                                      for i in range(self.monitorButtonLayout.count())]):
                 btn = btn.widget()
@@ -575,14 +1389,23 @@ class MainWindow(QMainWindow):
                 else:
                     btn.setStyleSheet("")
 
+                btn.setEnabled(i < len(self.screenshots))
+
     def copy_image(self):
-        if self.clipboard:
-            self.clipboard.setImage(self.get_current_screenshot().toqimage())
+        if self.get_current_screenshot() is None:
+            print("Copy: This monitor wasn't captured")
+        elif self.clipboard:
+            # The clipboard can outlive the frame, so it gets its own copy of the pixels
+            self.clipboard.setImage(self.get_current_screenshot().to_qimage().copy())
             print("Copy: Copied image to clipboard")
         else:
             print("Copy: Clipboard reference missing")
 
     def save_image(self):
+        if self.get_current_screenshot() is None:
+            print("Save: This monitor wasn't captured")
+            return
+
         filename, filter = QFileDialog.getSaveFileName(
             self,
             "Screpo: Save Image As...",
@@ -607,8 +1430,37 @@ class MainWindow(QMainWindow):
 
         self.settingsWidget.show()
 
-    def get_current_screenshot(self):
-        return self.screenshots[self.currentMonitor]
+    def get_current_screenshot(self) -> Frame | None:
+        return self.screenshots[self.currentMonitor] if self.currentMonitor < len(self.screenshots) else None
+
+    # Leaves out the whole desktop frame that desktop captures end with, as it's just the monitors again
+    def get_current_screenshots(self) -> list[Frame | None]:
+        return self.screenshots[:len(self.utils.monitors)]
+
+    def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        self.captureWorker.stop()
+        self.previews.shutdown()
+        self.utils.history.shutdown()
+
+        if self.utils.library:
+            self.utils.library.close()
+
+        if self.utils.windowIndex:
+            self.utils.windowIndex.stop()
+
+        if self.utils.hotkeys:
+            self.utils.hotkeys.stop()
+
+        if self.control:
+            self.control.close()
+
+        if self.utils.discordRef:
+            self.utils.discordRef.outbox.stop()
+            self.utils.discordRef.uploads.shutdown()
+
+        self.utils.capture.close()
+
+        super().closeEvent(event)
 
 
 class SettingsWindow(QMainWindow):
@@ -623,6 +1475,12 @@ class SettingsWindow(QMainWindow):
 
         self.setWindowFlag(Qt.WindowType.WindowMaximizeButtonHint, False)
 
+        # Applying the history settings can mean resizing the spill file, so wait until the numbers stop changing
+        self.historySettingsTimer = QTimer(self)
+        self.historySettingsTimer.setSingleShot(True)
+        self.historySettingsTimer.setInterval(750)
+        self.historySettingsTimer.timeout.connect(self.utils.apply_history_settings)
+
         self.tabs = QTabWidget(self)
 
         self.tab_general = SettingsTab()
@@ -670,6 +1528,63 @@ class SettingsWindow(QMainWindow):
         self.tab_general__enable_discord.setChecked(self.settings.values["general"]["features"]["enable_discord"])
         self.tab_general__enable_discord.clicked.connect(self.enable_discord_features)
 
+        self.tab_general__enable_library = SettingsCheckbox("Keep every capture in a library")
+        self.tab_general__enable_library.setToolTip(f"Captures are saved to {NEW_DIR}library/ and reloaded "
+                                                    f"into the history when Screpo starts")
+        self.tab_general__enable_library.setChecked(self.settings.values["general"]["features"]["enable_library"])
+        self.tab_general__enable_library.clicked.connect(self.enable_library_features)
+
+        self.tab_general__enable_hotkeys = SettingsCheckbox("Enable global hotkeys")
+        self.tab_general__enable_hotkeys.setToolTip(
+            f"Capture with {self.settings.values['hotkeys']['capture']} and capture a region with "
+            f"{self.settings.values['hotkeys']['capture_region']} from anywhere (X11 only). "
+            f"The keys can be changed in {NEW_DIR + FILE}")
+        self.tab_general__enable_hotkeys.setChecked(self.settings.values["general"]["features"]["enable_hotkeys"])
+        self.tab_general__enable_hotkeys.clicked.connect(self.enable_hotkey_features)
+
+        self.tab_general__enable_remote = SettingsCheckbox("Let other programs on this computer control Screpo")
+        self.tab_general__enable_remote.setToolTip("Scripts can take screenshots and read the history through the "
+                                                   "control socket, and opening Screpo again brings this one back")
+        self.tab_general__enable_remote.setChecked(self.settings.values["general"]["features"]["enable_remote"])
+        self.tab_general__enable_remote.clicked.connect(self.enable_remote_features)
+
+        self.tab_general__capture_header = QLabel("Capture")
+
+        self.tab_general__hide_mode_item = QHBoxLayout()
+        self.tab_general__hide_mode = QComboBox()
+        self.tab_general__hide_mode.addItems(["Wait for Screpo to hide", "Paint over Screpo"])
+        self.tab_general__hide_mode.setToolTip("Painting over Screpo captures straight away and fills the area "
+                                               "covered by the window with the previous screenshot")
+        self.tab_general__hide_mode.setCurrentIndex(
+            ["wait", "composite"].index(self.settings.values["general"]["capture"]["hide_mode"]))
+        self.tab_general__hide_mode.currentIndexChanged.connect(self.on_hide_mode_changed)
+
+        self.tab_general__capture_mode_item = QHBoxLayout()
+        self.tab_general__capture_mode = QComboBox()
+        self.tab_general__capture_mode.addItems(["Each monitor separately", "Whole desktop at once",
+                                                 "Only the monitor being viewed"])
+        self.tab_general__capture_mode.setToolTip("Capturing the whole desktop grabs every monitor in one go and adds "
+                                                  "the desktop as a single image alongside them. Capturing only the "
+                                                  "monitor being viewed grabs the others when you switch to them")
+        self.tab_general__capture_mode.setCurrentIndex(
+            CAPTURE_MODES.index(self.settings.values["general"]["capture"]["capture_mode"]))
+        self.tab_general__capture_mode.currentIndexChanged.connect(self.on_capture_mode_changed)
+
+        self.tab_general__capture_mode_item.addWidget(QLabel("Capture Mode"))
+        self.tab_general__capture_mode_item.addSpacerItem(
+            QSpacerItem(20, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+        self.tab_general__capture_mode_item.addWidget(self.tab_general__capture_mode)
+
+        self.tab_general__hide_mode_item.addWidget(QLabel("Hiding Method"))
+        self.tab_general__hide_mode_item.addSpacerItem(
+            QSpacerItem(20, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+        self.tab_general__hide_mode_item.addWidget(self.tab_general__hide_mode)
+
+        self.tab_general__hide_timeout = SettingsSpinBox("Hide Timeout (ms)", self.utils,
+                                                         ("general", "capture", "hide_timeout_ms"), 5000)
+        self.tab_general__hide_timeout.spinBox.valueChanged.connect(
+            partial(self.change_spinbox_value, self.tab_general__hide_timeout.keys))
+
         self.tab_general__performance_header = QLabel("Performance")
 
         self.tab_general__max_history_items = SettingsSpinBox("Max History Items", self.utils,
@@ -677,6 +1592,38 @@ class SettingsWindow(QMainWindow):
         self.tab_general__max_history_items.spinBox.valueChanged.connect(
             partial(self.change_spinbox_value, self.tab_general__max_history_items.keys))
 
+        self.tab_general__history_budget = SettingsSpinBox("History Memory Budget (MB)", self.utils,
+                                                           ("general", "performance", "history_budget_mb"), 65536)
+        self.tab_general__history_budget.title.setToolTip("Older history items are dropped once the history "
+                                                          "takes up more memory than this")
+        self.tab_general__history_budget.spinBox.valueChanged.connect(
+            partial(self.change_spinbox_value, self.tab_general__history_budget.keys))
+
+        self.tab_general__hot_history_items = SettingsSpinBox("Uncompressed History Items", self.utils,
+                                                              ("general", "performance", "history_hot_items"))
+        self.tab_general__hot_history_items.title.setToolTip("The newest history items are kept uncompressed, "
+                                                             "everything older is compressed in the background")
+        self.tab_general__hot_history_items.spinBox.valueChanged.connect(
+            partial(self.change_spinbox_value, self.tab_general__hot_history_items.keys))
+
+        self.tab_general__history_spill = SettingsCheckbox("Move old history items to disk instead of dropping them")
+        self.tab_general__history_spill.setToolTip(f"Items over the memory budget are written to {SPILL_FILE}")
+        self.tab_general__history_spill.setChecked(self.settings.values["general"]["performance"]["history_spill"])
+        self.tab_general__history_spill.clicked.connect(self.enable_history_spill)
+
+        self.tab_general__history_spill_size = SettingsSpinBox("History Disk Space (MB)", self.utils,
+                                                               ("general", "performance", "history_spill_mb"), 65536)
+        self.tab_general__history_spill_size.spinBox.setKeyboardTracking(False)
+        self.tab_general__history_spill_size.spinBox.valueChanged.connect(
+            partial(self.change_spinbox_value, self.tab_general__history_spill_size.keys))
+
+        self.tab_general__history_usage = QLabel()
+        self.update_history_usage()
+
+        self.historyUsageTimer = QTimer(self)
+        self.historyUsageTimer.timeout.connect(self.update_history_usage)
+        self.historyUsageTimer.start(1000)
+
         self.tab_general.layout().addWidget(self.tab_general__appearance_header)
         self.tab_general.layout().addWidget(HLine())
         self.tab_general.layout().addLayout(self.tab_general__theme_item)
@@ -684,10 +1631,24 @@ class SettingsWindow(QMainWindow):
         self.tab_general.layout().addWidget(HLine())
         self.tab_general.layout().addWidget(self.tab_general__enable_opencv)
         self.tab_general.layout().addWidget(self.tab_general__enable_discord)
+        self.tab_general.layout().addWidget(self.tab_general__enable_library)
+        self.tab_general.layout().addWidget(self.tab_general__enable_hotkeys)
+        self.tab_general.layout().addWidget(self.tab_general__enable_remote)
+        self.tab_general.layout().addSpacerItem(CategorySpacer())
+        self.tab_general.layout().addWidget(self.tab_general__capture_header)
+        self.tab_general.layout().addWidget(HLine())
+        self.tab_general.layout().addLayout(self.tab_general__hide_mode_item)
+        self.tab_general.layout().addLayout(self.tab_general__hide_timeout)
+        self.tab_general.layout().addLayout(self.tab_general__capture_mode_item)
         self.tab_general.layout().addSpacerItem(CategorySpacer())
         self.tab_general.layout().addWidget(self.tab_general__performance_header)
         self.tab_general.layout().addWidget(HLine())
         self.tab_general.layout().addLayout(self.tab_general__max_history_items)
+        self.tab_general.layout().addLayout(self.tab_general__history_budget)
+        self.tab_general.layout().addLayout(self.tab_general__hot_history_items)
+        self.tab_general.layout().addWidget(self.tab_general__history_spill)
+        self.tab_general.layout().addLayout(self.tab_general__history_spill_size)
+        self.tab_general.layout().addWidget(self.tab_general__history_usage)
         self.tab_general.layout().addStretch(3)
 
         self.tab_opencv = SettingsTab()
@@ -698,13 +1659,25 @@ class SettingsWindow(QMainWindow):
         self.tab_discord__username.title.setToolTip("If no username is provided when creating a url, "
                                                     "this will be used instead.")
 
+        self.tab_discord__upload_limit = SettingsSpinBox("Upload Limit (MB)", self.utils,
+                                                         ("discord", "upload_limit_mb"), 500)
+        self.tab_discord__upload_limit.title.setToolTip("Images are compressed, and scaled down if they have to be, "
+                                                        "to fit in this. Discord allows 10 MB without Nitro")
+        self.tab_discord__upload_limit.spinBox.valueChanged.connect(
+            partial(self.change_spinbox_value, self.tab_discord__upload_limit.keys))
+
         # self.tab_discord__webhook = SettingsLineEdit("Webhook URL", self.utils, ("discord", "webhook_url"))
         self.tab_discord__webhooks = ListEditor(self.utils)
+        self.tab_discord__groups = GroupListEditor(self.utils)
 
         self.tab_discord.layout().addLayout(self.tab_discord__username)
+        self.tab_discord.layout().addLayout(self.tab_discord__upload_limit)
         self.tab_discord.layout().addSpacerItem(CategorySpacer())
         [self.tab_discord.layout().addWidget(w) for w in [QLabel("Webhooks"), HLine(),
                                                           self.tab_discord__webhooks]]
+        self.tab_discord.layout().addSpacerItem(CategorySpacer())
+        [self.tab_discord.layout().addWidget(w) for w in [QLabel("Webhook Groups"), HLine(),
+                                                          self.tab_discord__groups]]
         self.tab_discord.layout().addStretch(3)
 
         self.tabs.addTab(self.tab_general, "General")
@@ -717,6 +1690,24 @@ class SettingsWindow(QMainWindow):
         if BUILD == BuildType.DEVELOPMENT:
             dev_tab = SettingsTab()
 
+            self.tab_dev__capture_backend_item = QHBoxLayout()
+            self.tab_dev__capture_backend = QLabel()
+            self.update_capture_backend()
+
+            self.tab_dev__recalibrate = QPushButton("Recalibrate")
+            self.tab_dev__recalibrate.setToolTip("Time every capture backend again and switch to the fastest")
+            self.tab_dev__recalibrate.clicked.connect(self.recalibrate_capture_backend)
+
+            self.tab_dev__capture_backend_item.addWidget(self.tab_dev__capture_backend)
+            self.tab_dev__capture_backend_item.addSpacerItem(
+                QSpacerItem(20, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+            self.tab_dev__capture_backend_item.addWidget(self.tab_dev__recalibrate)
+
+            dev_tab.layout().addWidget(QLabel("Capture"))
+            dev_tab.layout().addWidget(HLine())
+            dev_tab.layout().addLayout(self.tab_dev__capture_backend_item)
+            dev_tab.layout().addStretch(3)
+
             self.tabs.insertTab(999999, dev_tab, "Dev")
 
         self.footer = QHBoxLayout()
@@ -732,6 +1723,10 @@ class SettingsWindow(QMainWindow):
         self.setCentralWidget(self.widget)
 
     def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        if self.historySettingsTimer.isActive():
+            self.historySettingsTimer.stop()
+            self.utils.apply_history_settings()
+
         self.parent.update()
         self.parent.settingsWidget = None
         super().closeEvent(event)
@@ -810,6 +1805,64 @@ class SettingsWindow(QMainWindow):
             self.tabs.removeTab(self.tabs.indexOf(self.tab_discord))
             print("Settings: Disabled Discord features")
 
+    def on_hide_mode_changed(self, index):
+        self.settings.values["general"]["capture"]["hide_mode"] = ["wait", "composite"][index]
+        self.settings.save()
+
+    def update_capture_backend(self):
+        latency = self.utils.captureLatency
+        self.tab_dev__capture_backend.setText(
+            f"Capture Backend: {self.utils.capture.backend.name} "
+            f"({f'{latency:.1f} ms' if latency is not None else 'chosen in settings, not timed'})")
+
+    def recalibrate_capture_backend(self):
+        self.tab_dev__capture_backend.setText("Capture Backend: Calibrating...")
+        self.utils.select_capture_backend(recalibrate=True)
+
+    def on_capture_mode_changed(self, index):
+        self.settings.values["general"]["capture"]["capture_mode"] = CAPTURE_MODES[index]
+        self.settings.save()
+
+    def enable_hotkey_features(self, value):
+        self.settings.values["general"]["features"]["enable_hotkeys"] = value
+        self.settings.save()
+        self.utils.check_refs()
+        self.parent.connect_hotkeys()
+
+    def enable_remote_features(self, value):
+        self.settings.values["general"]["features"]["enable_remote"] = value
+        self.settings.save()
+        self.parent.update_control_server()
+
+    def enable_library_features(self, value):
+        self.settings.values["general"]["features"]["enable_library"] = value
+        self.settings.save()
+        self.utils.check_refs()
+
+        print(f"Settings: {'Enabled' if value else 'Disabled'} the capture library")
+
     def change_spinbox_value(self, keys: tuple | list, value):
-        self.settings.values[keys[0]][keys[1]][keys[2]] = value
+        values = self.settings.values
+        for key in keys[:-1]:
+            values = values[key]
+
+        values[keys[-1]] = value
+        self.settings.save()
+
+        if keys[1] == "performance":
+            self.historySettingsTimer.start()
+
+    def enable_history_spill(self, value):
+        self.settings.values["general"]["performance"]["history_spill"] = value
         self.settings.save()
+        self.utils.apply_history_settings()
+
+    def update_history_usage(self):
+        text = (f"History Memory Usage: {self.utils.history.usage() / MEGABYTE:.1f} MB of "
+                f"{self.settings.values['general']['performance']['history_budget_mb']} MB "
+                f"({len(self.utils.history)} items)")
+
+        if self.settings.values["general"]["performance"]["history_spill"]:
+            text += f"\nHistory Disk Usage: {self.utils.history.spill_usage() / MEGABYTE:.1f} MB"
+
+        self.tab_general__history_usage.setText(text)
@@ -0,0 +1,132 @@
+import time
+from threading import Lock
+from typing import Callable
+
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+
+
+class CaptureWorker(QObject):
+    # The frames (or what went wrong), along with the options the capture was requested with
+    captured = Signal(list, dict)
+    failed = Signal(str, dict)
+
+    # Whatever a call returned, for running back on the thread connected to it
+    returned = Signal(object)
+
+    _requested = Signal()
+    _warm = Signal()
+    _called = Signal(object)
+
+    # prepare is run on the capture thread by warm_up, to get everything set up before the first capture.
+    # Options named in passthrough only come back out with captured, they aren't passed to grab
+    def __init__(self, grab: Callable[..., list], prepare: Callable[[], None] = None, passthrough: tuple = ()):
+        super().__init__()
+
+        self.grab = grab
+        self.prepare = prepare
+        self.passthrough = passthrough
+
+        # When (time.perf_counter) the last grab finished
+        self.grabbed_at: float | None = None
+
+        self.__lock = Lock()
+        self.__pending = False
+        self.__cancelled = False
+        self.__options = {}
+
+        self.thread = QThread()
+        self.thread.setObjectName("Screpo Capture")
+        self.moveToThread(self.thread)
+
+        self._requested.connect(self.__run)
+        self._warm.connect(self.__warm_up)
+        self._called.connect(self.__call)
+        self.thread.start()
+
+    def warm_up(self):
+        if self.prepare:
+            self._warm.emit()
+
+    # Runs fn on the capture thread in between captures, like switching backends while nothing is grabbing with them.
+    # Anything it returns comes back out with returned
+    def call(self, fn: Callable[[], object]):
+        self._called.emit(fn)
+
+    # Returns False if the request was merged into a capture that is already queued or running,
+    # so a burst of clicks only ever produces a single capture.
+    # Any keyword arguments are passed on to the grab function
+    def request(self, **options) -> bool:
+        with self.__lock:
+            if self.__pending:
+                print("Capture: Request coalesced into the pending capture")
+                return False
+
+            self.__pending = True
+            self.__cancelled = False
+            self.__options = options
+
+        self._requested.emit()
+        return True
+
+    def is_busy(self) -> bool:
+        with self.__lock:
+            return self.__pending
+
+    # The grab itself can't be interrupted, but the result of a cancelled capture is thrown away
+    def cancel(self):
+        with self.__lock:
+            if self.__pending:
+                self.__cancelled = True
+                print("Capture: Pending capture cancelled")
+
+    def stop(self):
+        self.cancel()
+        self.thread.quit()
+        self.thread.wait()
+
+    @Slot()
+    def __warm_up(self):
+        try:
+            self.prepare()
+        except Exception as e:
+            print(f"Capture: Failed to warm up the capture path ({e})")
+
+    @Slot(object)
+    def __call(self, fn: Callable[[], object]):
+        try:
+            result = fn()
+        except Exception as e:
+            print(f"Capture: Failed to run {getattr(fn, '__name__', fn)} on the capture thread ({e})")
+            return
+
+        if result is not None:
+            self.returned.emit(result)
+
+    @Slot()
+    def __run(self):
+        shots, error = None, None
+
+        # A new request can replace the options as soon as this one stops being pending,
+        # so the capture is reported with the options it was actually taken with
+        with self.__lock:
+            options = self.__options
+
+        try:
+            shots = self.grab(**{k: v for k, v in options.items() if k not in self.passthrough})
+        except Exception as e:
+            error = e
+
+        self.grabbed_at = time.perf_counter()
+
+        with self.__lock:
+            self.__pending = False
+            cancelled = self.__cancelled
+
+        if cancelled:
+            return
+
+        if error is not None:
+            print(f"Capture: Failed to capture monitors ({error})")
+            self.failed.emit(str(error), options)
+        else:
+            self.captured.emit(shots, options)
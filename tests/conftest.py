@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+
+    # A full application rather than a core one, so tests can make windows too
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+# Runs the Qt event loop until condition() is true (or the timeout passes), so queued signals get delivered
+def wait_until(condition, timeout: float = 5):
+    from PySide6.QtCore import QCoreApplication, QDeadlineTimer, QEventLoop
+
+    deadline = QDeadlineTimer(int(timeout * 1000))
+    while not condition() and not deadline.hasExpired():
+        QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 10)
+
+    return condition()
+
+
+# A virtual X server of its own, for anything that talks to X11 directly
+@pytest.fixture(scope="session")
+def xvfb():
+    import shutil
+    import subprocess
+
+    pytest.importorskip("Xlib")
+    if not shutil.which("Xvfb"):
+        pytest.skip("Xvfb isn't installed")
+
+    # Xvfb picks a free display itself and writes its number to the pipe once it's ready
+    read, write = os.pipe()
+    process = subprocess.Popen(["Xvfb", "-displayfd", str(write), "-screen", "0", "1280x720x24", "-nolisten", "tcp"],
+                               pass_fds=(write,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write)
+
+    with os.fdopen(read) as f:
+        number = f.readline().strip()
+
+    if not number:
+        process.kill()
+        pytest.skip("Xvfb didn't start")
+
+    yield f":{number}"
+
+    process.terminate()
+    process.wait()
+
+
+def thread_running(name: str) -> bool:
+    import threading
+
+    return any(thread.name == name for thread in threading.enumerate())
+
+
+class StubBackend:
+    name = "stub"
+
+    def grab(self, region: dict):
+        from frame import Frame
+
+        width, height = region["width"], region["height"]
+        return Frame(bytearray(width * height * 4), width, height, width * 4)
+
+    def prepare(self):
+        pass
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# The real window on one 640x480 monitor, capturing from a stub backend and keeping its settings in tmp_path
+@pytest.fixture
+def window(qapp, tmp_path, monkeypatch):
+    pytest.importorskip("mss")
+
+    import capture
+    import utils
+    import widgets
+
+    monitors = [{"left": 0, "top": 0, "width": 640, "height": 480}]
+    defaults = utils.Settings.get_default_settings
+
+    def settings():
+        values = defaults()
+        values["general"]["features"]["enable_remote"] = False
+        values["general"]["capture"]["backend"] = StubBackend.name
+        return values
+
+    monkeypatch.chdir(os.path.join(os.path.dirname(__file__), ".."))
+    monkeypatch.setattr(utils, "NEW_DIR", str(tmp_path) + "/")
+    monkeypatch.setattr(utils.Settings, "get_default_settings", staticmethod(settings))
+    monkeypatch.setattr(utils, "BACKENDS", {StubBackend.name: StubBackend})
+    monkeypatch.setattr(capture.CaptureSession, "monitors", lambda self: ({**monitors[0]}, [*monitors]))
+
+    window = widgets.MainWindow(utils=utils.Utils(qapp))
+    window.show()
+
+    yield window
+
+    window.close()
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("mss")
+
+from capture import CaptureSession, tiled_bounds
+from frame import Frame
+
+LEFT = {"left": 0, "top": 0, "width": 4, "height": 2}
+RIGHT = {"left": 4, "top": 0, "width": 3, "height": 2}
+
+
+class Backend:
+    name = "fake"
+
+    def __init__(self):
+        self.grabs = []
+
+    # Every pixel holds its own desktop x and y, so crops can be checked against where they came from
+    def grab(self, region: dict) -> Frame:
+        self.grabs.append(region)
+
+        buffer = bytearray()
+        for y in range(region["top"], region["top"] + region["height"]):
+            for x in range(region["left"], region["left"] + region["width"]):
+                buffer += bytes((x, y, 0, 255))
+
+        return Frame(buffer, region["width"], region["height"])
+
+    def close(self):
+        pass
+
+
+def pixels(frame: Frame) -> list[tuple]:
+    return [tuple(frame.row(y)[x * 4:x * 4 + 2]) for y in range(frame.height) for x in range(frame.width)]
+
+
+def test_side_by_side_monitors_are_grabbed_at_once():
+    backend = Backend()
+    shots = CaptureSession(backend).grab_monitors([LEFT, RIGHT])
+
+    assert backend.grabs == [{"left": 0, "top": 0, "width": 7, "height": 2}]
+    assert shots[0].buffer is shots[1].buffer
+    assert pixels(shots[0]) == pixels(Backend().grab(LEFT))
+    assert pixels(shots[1]) == pixels(Backend().grab(RIGHT))
+
+
+@pytest.mark.parametrize("monitors", [
+    # A gap between them
+    [LEFT, {**RIGHT, "left": 5}],
+    # Different heights leave part of the bounding box off screen
+    [LEFT, {**RIGHT, "height": 3}],
+    # Mirrored
+    [LEFT, LEFT],
+    [LEFT]
+])
+def test_other_layouts_are_grabbed_one_by_one(monitors):
+    backend = Backend()
+    shots = CaptureSession(backend).grab_monitors(monitors)
+
+    assert backend.grabs == monitors
+    assert [s.size for s in shots] == [(m["width"], m["height"]) for m in monitors]
+
+
+def test_overlaps_are_not_tiled():
+    # Covers the bounding box with the right total area, but only because the overlap makes up for a gap
+    monitors = [{"left": 0, "top": 0, "width": 2, "height": 2}, {"left": 1, "top": 0, "width": 2, "height": 2},
+                {"left": 0, "top": 2, "width": 1, "height": 1}]
+
+    assert tiled_bounds(monitors) is None
@@ -0,0 +1,74 @@
+import os
+import socket
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+if not hasattr(socket, "AF_UNIX"):
+    pytest.skip("the control socket needs unix sockets", allow_module_level=True)
+
+from control import ControlServer
+from remote import is_answering
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "screpo.sock")
+
+
+def test_stale_socket_is_replaced(qapp, path):
+    # Bound but never listened on, like one left behind by a Screpo that crashed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    assert not is_answering(path)
+
+    server = ControlServer(None, path)
+    try:
+        assert server.server.isListening()
+        assert is_answering(path)
+    finally:
+        server.close()
+
+
+def test_running_instance_keeps_its_socket(qapp, path):
+    running = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    running.bind(path)
+    running.listen()
+
+    try:
+        server = ControlServer(None, path)
+        server.close()
+
+        assert not server.server.isListening()
+        assert os.path.exists(path)
+        assert is_answering(path)
+    finally:
+        running.close()
+
+
+def test_remote_region_capture_leaves_the_window_alone(window, path):
+    from threading import Thread
+
+    window.control = ControlServer(window.utils.history, path)
+    window.control.captureRequested.connect(window.on_remote_capture)
+
+    from conftest import wait_until
+    from remote import RemoteScrepo
+
+    replies = []
+
+    def capture():
+        with RemoteScrepo(path) as remote:
+            replies.append(remote.capture(region=(0, 0, 100, 100)))
+
+    client = Thread(target=capture)
+    client.start()
+    assert wait_until(lambda: replies)
+    client.join()
+
+    id, frames = replies[0]
+    assert (frames[0].width, frames[0].height) == (100, 100)
+    assert window.isVisible() and not window.isMinimized()
+    assert window.lazyEntry is None
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from PIL import Image, ImageDraw
+
+from encoding import CANDIDATES, encode_to_budget
+from frame import Frame
+
+
+# A dark desktop with a few light windows full of text, like the screenshots that actually get sent
+def screenshot(width: int, height: int, density: float, seed: int) -> Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (32, 33, 36))
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(6):
+        w, h = rng.randrange(width // 6, width // 2), rng.randrange(height // 5, height // 2)
+        x, y = rng.randrange(0, width - w), rng.randrange(0, height - h)
+
+        draw.rectangle((x, y, x + w, y + h), fill=(250, 250, 250), outline=(90, 90, 90))
+        draw.rectangle((x, y, x + w, y + 28), fill=(60, 64, 72))
+
+        for i in range(int((h - 40) / 14 * density)):
+            text = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz     ()=._0123456789")
+                           for _ in range(rng.randrange(10, w // 7)))
+            draw.text((x + 8, y + 34 + i * 14), text, fill=(rng.randrange(0, 120),) * 3)
+
+    return image
+
+
+CONTENT = [(3840, 2160, 1.0, 1), (3840, 2160, 0.2, 2), (1920, 1080, 0.5, 3)]
+
+
+@pytest.fixture(scope="module", params=CONTENT, ids=lambda c: f"{c[0]}x{c[1]}-{c[2]}")
+def content(request):
+    image = screenshot(*request.param)
+    sizes = {c.name: len(c.encode(image)) for c in CANDIDATES}
+
+    return Frame.from_image(image), sizes
+
+
+@pytest.mark.parametrize("headroom", [1.01, 1.1, 1.5])
+def test_lossless_is_chosen_whenever_it_fits(content, headroom):
+    frame, sizes = content
+    budget = int(min(sizes[c.name] for c in CANDIDATES if c.lossless) * headroom)
+
+    encoded = encode_to_budget(frame, budget)
+
+    assert encoded.candidate.lossless
+    assert encoded.size == frame.size
+    assert len(encoded.data) <= budget
+
+
+def test_fast_png_is_preferred_when_it_fits(content):
+    frame, sizes = content
+
+    encoded = encode_to_budget(frame, sizes["png-fast"] * 2)
+
+    assert encoded.candidate.name == "png-fast"
+    assert encoded.attempts == 1
+
+
+def test_scales_down_when_nothing_fits(content):
+    frame, sizes = content
+    budget = min(sizes.values()) // 4
+
+    encoded = encode_to_budget(frame, budget)
+
+    assert not encoded.candidate.lossless
+    assert encoded.size[0] < frame.width
+    assert len(encoded.data) <= budget
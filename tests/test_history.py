@@ -0,0 +1,130 @@
+import os
+import random
+import time
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from conftest import wait_until
+from frame import Frame
+from history import EntryFrames, History, is_captured
+
+
+def frame(width: int, height: int, value: int) -> Frame:
+    return Frame(bytearray([value]) * (width * height * 4), width, height)
+
+
+def wait_for_cold(history: History, id: int, timeout: float = 5) -> EntryFrames:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        frames = history.frames(id)
+        if isinstance(frames, EntryFrames):
+            return frames
+        time.sleep(0.01)
+
+    raise AssertionError(f"entry {id} never went cold")
+
+
+def test_cold_entries_are_only_rebuilt_when_a_frame_is_needed(monkeypatch):
+    history = History(max_items=4, hot_items=1)
+
+    try:
+        first = history.add([frame(128, 64, 1), None])
+        history.add([frame(128, 64, 2)])
+
+        frames = wait_for_cold(history, first)
+        rebuilt = []
+        original = History.__getitem__
+        monkeypatch.setattr(History, "__getitem__", lambda self, id: rebuilt.append(id) or original(self, id))
+
+        # Everything needed to show the entry's previews and monitor buttons
+        assert len(frames) == 2
+        assert is_captured(frames, 0) and not is_captured(frames, 1)
+        assert rebuilt == []
+
+        assert frames[0].size == (128, 64)
+        assert bytes(frames[0].view()[:4]) == b"\x01" * 4
+        assert frames[1] is None
+        assert frames[:1][0] is frames[0]
+        assert rebuilt == [first]
+    finally:
+        history.shutdown()
+
+
+def test_hot_entries_are_handed_over_as_they_are():
+    history = History(max_items=4, hot_items=2)
+
+    try:
+        shots = [frame(32, 32, 3)]
+        frames = history.frames(history.add(shots))
+
+        assert frames == shots
+        assert frames is not shots
+    finally:
+        history.shutdown()
+
+
+def noise(width: int, height: int, seed: int) -> Frame:
+    return Frame(bytearray(random.Random(seed).randbytes(width * height * 4)), width, height)
+
+
+def test_resizing_the_spill_keeps_what_fits(tmp_path):
+    history = History(max_items=8, budget_mb=1, hot_items=1)
+    path = str(tmp_path / "spill.bin")
+
+    try:
+        history.set_spill(path, 8)
+
+        # About 1 MB each, which doesn't compress, so everything but the newest goes to disk
+        frames = {history.add([noise(512, 512, i)]): i for i in range(4)}
+        ids = list(frames)
+        # Spilling waits for each entry to be encoded first
+        assert wait_until(lambda: history.spill_usage() > 2.5 * 1024 * 1024)
+
+        history.set_spill(path, 2)
+
+        assert ids[0] not in history and ids[1] not in history
+        for id in ids[2:]:
+            assert bytes(history[id][0].view()) == bytes(noise(512, 512, frames[id]).view())
+
+        assert os.path.getsize(path) == 2 * 1024 * 1024
+        assert not os.path.exists(path + ".new")
+    finally:
+        history.shutdown()
+
+
+def test_over_budget_entries_are_spilled_on_the_encoder(tmp_path, monkeypatch):
+    import threading
+    import zlib
+
+    history = History(max_items=8, budget_mb=1, hot_items=8)
+    compressed_on = set()
+    compress = zlib.compress
+    monkeypatch.setattr(zlib, "compress", lambda *args: compressed_on.add(threading.current_thread()) or compress(*args))
+
+    try:
+        history.set_spill(str(tmp_path / "spill.bin"), 8)
+
+        ids = [history.add([noise(512, 512, i)]) for i in range(3)]
+
+        assert wait_until(lambda: history.spill_usage() > 1024 * 1024)
+        assert threading.current_thread() not in compressed_on
+        assert bytes(history[ids[0]][0].view()) == bytes(noise(512, 512, 0).view())
+    finally:
+        history.shutdown()
+
+
+def test_turning_spilling_off_removes_the_file(tmp_path):
+    history = History()
+    path = str(tmp_path / "spill.bin")
+
+    try:
+        history.set_spill(path, 4)
+        assert os.path.exists(path)
+
+        history.set_spill(None)
+        assert not os.path.exists(path)
+    finally:
+        history.shutdown()
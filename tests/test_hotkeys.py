@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import thread_running, wait_until
+
+pytest.importorskip("PySide6")
+
+from features.hotkeys import create_hotkey_listener
+
+
+def test_hotkey_is_triggered_and_stops(qapp, xvfb):
+    from Xlib import X, XK, display
+    from Xlib.ext import xtest
+
+    listener = create_hotkey_listener("xcb", {"capture": "ctrl+shift+s"}, xvfb)
+    assert listener is not None
+
+    triggered = []
+    listener.triggered.connect(lambda action, pressed: triggered.append(action))
+
+    client = display.Display(xvfb)
+
+    try:
+        keys = [client.keysym_to_keycode(XK.string_to_keysym(key)) for key in ("Control_L", "Shift_L", "s")]
+        for key in keys:
+            xtest.fake_input(client, X.KeyPress, key)
+        for key in reversed(keys):
+            xtest.fake_input(client, X.KeyRelease, key)
+        client.sync()
+
+        assert wait_until(lambda: triggered)
+        assert triggered == ["capture"]
+    finally:
+        client.close()
+        listener.stop()
+
+    assert not thread_running("Screpo Hotkeys")
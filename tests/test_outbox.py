@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("PySide6")
+pytest.importorskip("requests")
+
+from PySide6.QtCore import QObject, Signal
+
+from features.outbox import Outbox
+from features.uploads import Upload
+
+
+# Runs the encode step (which is what writes the item to the outbox) and leaves the rest to each test
+class Queue(QObject):
+    finished = Signal(int, bool, bool, str)
+
+    def __init__(self):
+        super().__init__()
+        self.uploads = []
+
+    def submit(self, upload: Upload) -> int:
+        upload.files = upload.files()
+        self.uploads.append(upload)
+        return len(self.uploads)
+
+
+@pytest.fixture
+def outbox(qapp, tmp_path):
+    queue = Queue()
+    outbox = Outbox(queue, str(tmp_path) + "/")
+    outbox.warnings = []
+    outbox.failed.connect(lambda *args: outbox.warnings.append(args))
+
+    yield outbox, queue
+    outbox.stop()
+
+
+def send(outbox: Outbox) -> int:
+    files = [("file", ("shot.png", b"png", "image/png"))]
+    return outbox.submit(Upload("http://localhost/webhook", {"username": "screpo"}, lambda: files, "hook"), [])
+
+
+def test_first_failure_says_it_will_be_retried(outbox):
+    outbox, queue = outbox
+    id = send(outbox)
+
+    queue.finished.emit(id, False, False, "Gave up")
+
+    assert outbox.warnings == [(id, "hook", "Gave up", True)]
+    assert len(outbox.pending()) == 1
+
+
+def test_failed_resends_stay_quiet(outbox):
+    outbox, queue = outbox
+    queue.finished.emit(send(outbox), False, False, "Gave up")
+
+    outbox.drain()
+    queue.finished.emit(len(queue.uploads), False, False, "Gave up")
+
+    assert len(queue.uploads) == 2
+    assert queue.uploads[1].headers == queue.uploads[0].headers
+    assert len(outbox.warnings) == 1
+    assert len(outbox.pending()) == 1
+
+
+def test_refused_uploads_are_dropped(outbox):
+    outbox, queue = outbox
+    id = send(outbox)
+
+    class Response:
+        status_code = 400
+
+    queue.uploads[0].on_rejected(Response())
+    queue.finished.emit(id, False, True, "Rejected")
+
+    assert outbox.warnings == [(id, "hook", "Rejected", False)]
+    assert outbox.pending() == []
@@ -0,0 +1,42 @@
+import time
+from threading import Thread
+
+import pytest
+
+from conftest import wait_until
+
+pytest.importorskip("PySide6")
+
+import qtcapture
+from qtcapture import QtBackend
+
+FIRST = {"left": 0, "top": 0, "width": 10, "height": 10}
+SECOND = {"left": 10, "top": 0, "width": 20, "height": 20}
+
+
+# Hands back the region it was asked for, taking long enough over the first one for its caller to give up.
+# The second one takes a moment too, so anything the late first grab leaves behind is seen before it's replaced
+class SlowBackend(QtBackend):
+    def grab_here(self, region: dict):
+        time.sleep(0.3 if region == FIRST else 0.05)
+        return region
+
+
+def test_late_grabs_do_not_answer_later_requests(qapp, monkeypatch):
+    monkeypatch.setattr(qtcapture, "GRAB_TIMEOUT", 0.2)
+    backend = SlowBackend()
+    results = []
+
+    def grab():
+        for region in (FIRST, SECOND):
+            try:
+                results.append(backend.grab(region))
+            except TimeoutError:
+                results.append("timed out")
+
+    thread = Thread(target=grab)
+    thread.start()
+    assert wait_until(lambda: len(results) == 2)
+    thread.join()
+
+    assert results == ["timed out", SECOND]
@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import wait_until
+
+pytest.importorskip("PySide6")
+requests = pytest.importorskip("requests")
+
+from features.uploads import Upload, UploadQueue, retry_after
+
+
+def response(status: int, headers: dict = None) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status
+    r.headers.update(headers or {})
+    r._content = b"{}"
+    return r
+
+
+class Session:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def post(self, *args, **kwargs):
+        return self.responses.pop(0)
+
+
+def test_retry_after_zero_is_kept():
+    assert retry_after(response(429, {"Retry-After": "0"})) == 0
+    assert retry_after(response(429)) is None
+
+
+def test_retry_after_zero_retries_straight_away(qapp):
+    queue = UploadQueue(workers=1)
+    queue.session = lambda url: Session(response(429, {"Retry-After": "0"}), response(200))
+
+    progress, results = [], []
+    queue.progress.connect(lambda id, message: progress.append(message))
+    queue.finished.connect(lambda id, ok, rejected, message: results.append(ok))
+
+    try:
+        queue.submit(Upload("https://example.com/webhook", {}, []))
+        assert wait_until(lambda: results)
+    finally:
+        queue.shutdown()
+
+    assert results == [True]
+    assert "Waiting 0s (429)" in progress
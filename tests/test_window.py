@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+from conftest import wait_until
+
+pytest.importorskip("PySide6")
+
+
+def capture(window, **options):
+    entries = len(window.utils.history)
+    window.update_screenshots(True, **options)
+    assert wait_until(lambda: len(window.utils.history) > entries)
+
+
+def test_only_accepted_hotkeys_are_timed(window, capsys):
+    # A hotkey pressed while another capture is underway is merged into it, and isn't timed
+    window.captureWorker.is_busy = lambda: True
+    window.on_hotkey("capture", time.perf_counter())
+    del window.captureWorker.is_busy
+
+    capture(window)
+    assert "Hotkeys:" not in capsys.readouterr().out
+
+    window.on_hotkey("capture", time.perf_counter())
+    output = []
+    assert wait_until(lambda: output.append(capsys.readouterr().out) or "Hotkeys:" in "".join(output))
@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import thread_running, wait_until
+
+pytest.importorskip("PySide6")
+
+from features.windows import create_window_index
+
+DESKTOP = {"left": 0, "top": 0, "width": 1280, "height": 720}
+
+
+def titles(index, monitor: dict = DESKTOP) -> list[str]:
+    return [window.title for window in index.windows_on(monitor)]
+
+
+def test_index_follows_window_events(qapp, xvfb):
+    from Xlib import display
+
+    index = create_window_index("xcb", xvfb)
+    assert index is not None
+
+    client = display.Display(xvfb)
+    screen = client.screen()
+
+    try:
+        windows = []
+        for i, title in enumerate(["Beta", "Alpha", "Gamma"]):
+            window = screen.root.create_window(10 + 300 * i, 20, 200, 100, 0, screen.root_depth)
+            window.set_wm_name(title)
+            window.map()
+            windows.append(window)
+        client.flush()
+
+        assert wait_until(lambda: titles(index) == ["Alpha", "Beta", "Gamma"])
+        assert index.get(windows[1].id).region == (310, 20, 200, 100)
+
+        windows[0].configure(x=700, y=400, width=320, height=240)
+        client.flush()
+        assert wait_until(lambda: index.get(windows[0].id).region == (700, 400, 320, 240))
+        assert titles(index, {"left": 640, "top": 360, "width": 640, "height": 360}) == ["Beta"]
+
+        windows[1].set_wm_name("Delta")
+        client.flush()
+        assert wait_until(lambda: index.get(windows[1].id).title == "Delta")
+
+        windows[2].unmap()
+        client.flush()
+        assert wait_until(lambda: titles(index) == ["Beta", "Delta"])
+
+        windows[0].destroy()
+        client.flush()
+        assert wait_until(lambda: index.get(windows[0].id) is None)
+    finally:
+        client.close()
+        index.stop()
+
+    assert not thread_running("Screpo Windows")
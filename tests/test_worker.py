@@ -0,0 +1,60 @@
+import pytest
+
+from conftest import wait_until
+
+pytest.importorskip("PySide6")
+
+from worker import CaptureWorker
+
+
+@pytest.fixture
+def worker(qapp):
+    calls = []
+
+    def grab(**options):
+        calls.append(options)
+        return ["frame"]
+
+    worker = CaptureWorker(grab, passthrough=("fill",))
+    worker.calls = calls
+    yield worker
+    worker.stop()
+
+
+def capture(worker, **options):
+    results = []
+    worker.captured.connect(lambda shots, emitted: results.append((shots, emitted)))
+    worker.failed.connect(lambda error, emitted: results.append(error))
+
+    assert worker.request(**options)
+    assert wait_until(lambda: results)
+
+    return results[0]
+
+
+def test_passthrough_options_skip_the_grab(worker):
+    shots, options = capture(worker, only=1, fill=7)
+
+    assert worker.calls == [{"only": 1}]
+    assert shots == ["frame"]
+    assert options == {"only": 1, "fill": 7}
+
+
+def test_other_options_reach_the_grab(worker):
+    _, options = capture(worker, region=(0, 0, 10, 10))
+
+    assert worker.calls == [{"region": (0, 0, 10, 10)}]
+    assert options == {"region": (0, 0, 10, 10)}
+
+
+def test_calls_run_on_the_capture_thread(worker):
+    from PySide6.QtCore import QThread
+
+    threads, returned = [], []
+    worker.returned.connect(lambda then: returned.append(then))
+
+    worker.call(lambda: threads.append(QThread.currentThread()) or "done")
+    assert wait_until(lambda: returned)
+
+    assert threads == [worker.thread]
+    assert returned == ["done"]